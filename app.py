@@ -6,21 +6,52 @@
 #
 # Usage: streamlit run app.py
 #
-# Dépendances: streamlit, pandas, openpyxl, plotly (facultatif pour graphiques existants)
+# Dépendances: streamlit, pandas, openpyxl, plotly (facultatif pour graphiques existants),
+# python-calamine (facultatif: lecture Excel plus rapide, sinon moteur pandas par défaut)
 # Placez Logo_ofppt.png dans le répertoire si vous voulez qu'il apparaisse dans les exports Excel et l'interface.
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.drawing.image import Image
 from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.worksheet import Worksheet
 from io import BytesIO
 from datetime import datetime, timedelta, date
-import copy
 import os
+import sys
 import re
+import threading
+import zipfile
+import hashlib
 import base64
+from functools import lru_cache
+from copy import copy as _copy
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import python_calamine  # noqa: F401  (moteur de lecture Excel rapide, facultatif)
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = None
+
+try:
+    import plotly.graph_objects as go  # graphique de charge (facultatif)
+except ImportError:
+    go = None
+
+# Lignes examinées en premier pour trouver l'en-tête d'un onglet
+HEADER_SCAN_ROWS = 50
+
+# Threads pour la lecture des onglets (un lecteur par thread) et la préparation des packs
+EXCEL_WORKERS = min(8, os.cpu_count() or 1)
+
+# Classeurs analysés gardés en mémoire (cache partagé entre sessions, plus anciens évincés)
+EXCEL_CACHE_ENTRIES = 4
 
 # Configuration Streamlit
 st.set_page_config(
@@ -37,6 +68,16 @@ if 'resolved_data' not in st.session_state:
     st.session_state['resolved_data'] = None
 if 'conflits_log' not in st.session_state:
     st.session_state['conflits_log'] = pd.DataFrame()
+if 'hours_index' not in st.session_state:
+    st.session_state['hours_index'] = {}
+if 'slot_owners' not in st.session_state:
+    st.session_state['slot_owners'] = {}
+if 'salle_occupancy' not in st.session_state:
+    st.session_state['salle_occupancy'] = {}
+if 'week_cache' not in st.session_state:
+    st.session_state['week_cache'] = {}
+if 'pack_selection' not in st.session_state:
+    st.session_state['pack_selection'] = {}
 if 'niveau_global' not in st.session_state:
     st.session_state['niveau_global'] = "1ère Année"
 if 'force_25_to_26' not in st.session_state:
@@ -62,8 +103,8 @@ LOGO_HEIGHT_PIXELS = 70
 
 FALLBACK_SEMAINES = ['S1', 'S2', 'S3', 'S4']
 
-JOURS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi']
-CRENEAUX_JOUR = ['AM1', 'AM2', 'PM1', 'PM2']
+JOURS = ('Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi')
+CRENEAUX_JOUR = ('AM1', 'AM2', 'PM1', 'PM2')
 
 HORAIRES = {
     'AM1': '08H30-11H00',
@@ -73,6 +114,11 @@ HORAIRES = {
 }
 
 SLOT_DURATIONS = {'AM1': 2.5, 'AM2': 2.5, 'PM1': 2.5, 'PM2': 2.5}
+# Durées alignées sur l'ordre de CRENEAUX_JOUR (accès par index dans les boucles)
+SLOT_DURATIONS_ARR = tuple(SLOT_DURATIONS[c] for c in CRENEAUX_JOUR)
+TABLE_COLUMNS = ('JOUR',) + CRENEAUX_JOUR
+# Ligne d'en-tête des exports (JOUR + créneau et horaire)
+HEADER_ROW_TEXTS = ('JOUR',) + tuple(f"{c}\n{HORAIRES[c]}" for c in CRENEAUX_JOUR)
 
 MONTH_NAMES = {
     'Novembre': 'Novembre','Decembre': 'Décembre','Janvier':'Janvier','Février':'Février',
@@ -95,47 +141,104 @@ HOLIDAYS = [
     {'date': datetime(2026,1,14).date(), 'label': 'Nouvel an Amazigh'},
     {'date': datetime(2026,5,1).date(), 'label': 'Fête du travail'},
 ]
+HOLIDAY_MAP = {h['date']: h['label'] for h in HOLIDAYS}
 
 HOLIDAY_FILL = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
 HOLIDAY_FONT = Font(bold=True, color="000000")
 
+# Styles openpyxl partagés (immuables): créés une fois, assignés par référence
+_THIN = Side(style='thin', color='000000')
+_BORDER_ALL = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_EMPTY_BORDER = Border()
+_CENTER_WRAP = Alignment(horizontal='center', vertical='center', wrap_text=True)
+_CENTER = Alignment(horizontal='center', vertical='center')
+_LEFT_CENTER = Alignment(horizontal='left', vertical='center')
+_RIGHT_CENTER = Alignment(horizontal='right', vertical='center')
+_TITLE_FONT = Font(bold=True, size=14, name='Calibri')
+_META_FONT_BOLD = Font(bold=True, size=10, name='Calibri')
+_HEADER_FONT = Font(bold=True, size=10)
+_CELL_FONT = Font(size=10, bold=True)
+_JOUR_FONT = Font(bold=True)
+# Export de l'analyse de charge
+_CHARGE_SIDE = Side(style='thin')
+_CHARGE_BORDER = Border(left=_CHARGE_SIDE, right=_CHARGE_SIDE, top=_CHARGE_SIDE, bottom=_CHARGE_SIDE)
+_CHARGE_HEADER_FONT = Font(bold=True, size=11, color="FFFFFF")
+_CHARGE_TITLE_FONT = Font(bold=True, size=14, color="1e5631")
+_CHARGE_HEADER_FILL = PatternFill(start_color="2d8659", end_color="2d8659", fill_type="solid")
+CHARGE_EXPORT_HEADERS = ('Groupe', 'Heures de Formation', 'Nombre de Créneaux', 'Niveau de Charge', 'Écart/Moyenne')
+CHARGE_EXPORT_COLUMNS = ('Groupe', 'Heures de Formation', 'Nombre de Créneaux', 'Catégorie', 'Écart/Moyenne')
+# Nombre maximal de barres du graphique de charge (au-delà: plus et moins chargés)
+CHARGE_PLOT_MAX_GROUPES = 150
+
 # --- HELPER FUNCTION FOR LOGO ---
-def get_logo_src():
-    """Retourne le src du logo (base64 si fichier local existe, sinon URL)"""
+@lru_cache(maxsize=1)
+def _logo_bytes():
+    """Contenu du logo local lu une seule fois (None si absent ou illisible)"""
     if os.path.exists(LOGO_FILE_NAME):
         try:
             with open(LOGO_FILE_NAME, "rb") as f:
-                logo_base64 = base64.b64encode(f.read()).decode()
-            return f"data:image/png;base64,{logo_base64}"
+                return f.read()
         except Exception:
-            return LOGO_URL
-    return LOGO_URL
+            return None
+    return None
+
+def get_logo_src():
+    """Retourne le src du logo (base64 si fichier local existe, sinon URL)"""
+    logo = _logo_bytes()
+    if logo is None:
+        return LOGO_URL
+    return f"data:image/png;base64,{base64.b64encode(logo).decode()}"
 
 # --- DATE PARSING HELPERS ---
 ARROW_RE = re.compile(r'\s*(?:→|->|–|-)\s*')
-DATE_FORMATS = [
-    "%d/%m/%Y","%d/%m/%y","%d %b %Y","%d %B %Y","%d %b %y","%d %B %y","%Y-%m-%d","%d.%m.%Y",
-]
+_DATE_JUNK_RE = re.compile(r'[^\w\s\-/\.]')
+# Équivalents regex des anciens formats strptime ("%Y-%m-%d", "%d %b %Y", "%d %B %y", ...)
+_ISO_DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+_NAMED_DATE_RE = re.compile(r'(\d{1,2})\s+([A-Za-z]+)\s+(\d{4}|\d{2})')
+_SLASH_YY_RE = re.compile(r'\d{1,2}/\d{1,2}/\d{2}')
+# Repli numérique "j m a" (séparateurs espace - / .), éventuellement suivi d'autres éléments
+_NUMERIC_DATE_RE = re.compile(r'(\d+)[ \-/\.]+(\d+)[ \-/\.]+(\d+)(?:[ \-/\.]|$)')
+_EN_MONTHS = ('january', 'february', 'march', 'april', 'may', 'june', 'july',
+              'august', 'september', 'october', 'november', 'december')
+_MONTH_BY_NAME = {**{m: i for i, m in enumerate(_EN_MONTHS, start=1)},
+                  **{m[:3]: i for i, m in enumerate(_EN_MONTHS, start=1)}}
+
+def _strptime_year(yy):
+    # Règle de pivot de %y: 69-99 -> 19xx, 00-68 -> 20xx
+    return yy + (1900 if yy >= 69 else 2000)
 
 def try_parse_date(s):
     if not s or not isinstance(s, str):
         return None
-    s = s.strip()
-    s = re.sub(r'[^\w\s\-/\.]', ' ', s).strip()
-    for fmt in DATE_FORMATS:
-        try:
-            return datetime.strptime(s, fmt).date()
-        except Exception:
-            continue
-    parts = re.split(r'[ \-\\/\.]+', s)
-    if len(parts) >= 3:
-        try:
-            d = int(parts[0]); m = int(parts[1]); y = int(parts[2])
-            if y < 100: y += 2000
-            return datetime(y, m, d).date()
-        except Exception:
-            pass
-    return None
+    return _parse_date_text(s)
+
+@lru_cache(maxsize=4096)
+def _parse_date_text(s):
+    s = _DATE_JUNK_RE.sub(' ', s.strip()).strip()
+    m = _ISO_DATE_RE.fullmatch(s)
+    if m:
+        y, mo, d = (int(x) for x in m.groups())
+    else:
+        m = _NAMED_DATE_RE.fullmatch(s)
+        if m:
+            d = int(m.group(1))
+            mo = _MONTH_BY_NAME.get(m.group(2).lower())
+            y = int(m.group(3))
+            if mo is None:
+                return None
+            if len(m.group(3)) == 2:
+                y = _strptime_year(y)
+        else:
+            m = _NUMERIC_DATE_RE.match(s)
+            if not m:
+                return None
+            d, mo, y = (int(x) for x in m.groups())
+            if y < 100:
+                y = _strptime_year(y) if _SLASH_YY_RE.fullmatch(s) else y + 2000
+    try:
+        return date(y, mo, d)
+    except ValueError:
+        return None
 
 def parse_date_range_cell(cell):
     if not cell or not isinstance(cell, str):
@@ -148,6 +251,16 @@ def parse_date_range_cell(cell):
             return (d1, d2)
     return (None, None)
 
+@lru_cache(maxsize=8192)
+def slot_key(semaine_label, jour, creneau):
+    """Clé 'semaine-jour-créneau' d'un créneau, formatée et internée une seule fois."""
+    return sys.intern(f"{semaine_label}-{jour}-{creneau}")
+
+@lru_cache(maxsize=256)
+def day_slot_keys(semaine_label):
+    """Clés 'semaine-jour-créneau' d'une semaine, indexées [jour][créneau] (construites une fois)."""
+    return tuple(tuple(slot_key(semaine_label, jour, c) for c in CRENEAUX_JOUR) for jour in JOURS)
+
 def day_date(week_start, offset_days):
     if week_start is None:
         return None
@@ -156,11 +269,14 @@ def day_date(week_start, offset_days):
         return d.date()
     return d
 
+_SHEET_TITLE_RE = re.compile(r'[:\\\/\?\*\[\]]')
+
+@lru_cache(maxsize=2048)
 def sanitize_sheet_title(s, max_len=31):
     if s is None:
         return "Sheet1"
     s = str(s)
-    s = re.sub(r'[:\\\/\?\*\[\]]', '_', s)
+    s = _SHEET_TITLE_RE.sub('_', s)
     s = s.strip() or "sheet"
     if len(s) > max_len:
         s = s[:max_len]
@@ -173,35 +289,54 @@ def extract_month_name_from_sheet(sheet_name):
             return value
     return None
 
-def find_header_row(df):
-    for idx, row in df.iterrows():
-        vals = [str(x).strip() for x in row.values if pd.notna(x)]
-        lowvals = [v.lower() for v in vals]
-        if any(v in ('formateur','form') for v in lowvals) and any(c in vals for c in ['AM1','AM2','PM1','PM2']):
-            return idx
+def find_header_row(cells):
+    # L'en-tête est presque toujours en haut: premières lignes d'abord, reste de l'onglet ensuite
+    for start, stop in ((0, HEADER_SCAN_ROWS), (HEADER_SCAN_ROWS, len(cells))):
+        block = cells[start:stop]
+        if block.size == 0:
+            continue
+        txt = np.char.strip(block.astype(str))
+        has_form = np.isin(np.char.lower(txt), ('formateur', 'form')).any(axis=1)
+        has_creneau = np.isin(txt, CRENEAUX_JOUR).any(axis=1)
+        hits = np.flatnonzero(has_form & has_creneau)
+        if hits.size:
+            return start + int(hits[0])
     return None
 
-@st.cache_data(show_spinner=False)
-def parse_schedule_sheet(df, sheet_name):
+@lru_cache(maxsize=16)
+def _slot_layout(n_semaines):
+    """(indice semaine, jour, créneau, décalage de colonne) pour n semaines consécutives."""
+    return tuple(
+        (s_idx, j, c, (s_idx * len(JOURS) + j_idx) * len(CRENEAUX_JOUR) + c_idx)
+        for s_idx in range(n_semaines)
+        for j_idx, j in enumerate(JOURS)
+        for c_idx, c in enumerate(CRENEAUX_JOUR)
+    )
+
+def parse_schedule_sheet(cells, sheet_name):
+    """Analyse un onglet déjà lu en tableau numpy d'objets (cellules vides = '')."""
     month_name = extract_month_name_from_sheet(sheet_name)
     month_label = month_name if month_name else sheet_name
 
-    header_idx = find_header_row(df)
+    header_idx = find_header_row(cells)
     if header_idx is None:
         return None
 
-    header_row = df.iloc[header_idx]
+    header_row = cells[header_idx]
     search_top = max(0, header_idx - 10)
     found_map = {}
-    for ridx in range(search_top, header_idx):
-        row = df.iloc[ridx].astype(str).tolist()
-        for cidx, cell in enumerate(row):
-            txt = str(cell).strip()
-            if not txt:
-                continue
-            a,b = parse_date_range_cell(txt)
-            if a and b and cidx not in found_map:
-                found_map[cidx] = (txt, a, b)
+    # Zone au-dessus de l'en-tête: seules les cellules avec un séparateur de plage sont analysées,
+    # colonne par colonne, en s'arrêtant à la première plage valide (la plus haute)
+    block = np.char.strip(cells[search_top:header_idx].astype(str))
+    if block.size:
+        candidates = (np.char.find(block, '-') >= 0) | (np.char.find(block, '→') >= 0) | (np.char.find(block, '–') >= 0)
+        for cidx in np.flatnonzero(candidates.any(axis=0)):
+            for ridx in np.flatnonzero(candidates[:, cidx]):
+                txt = str(block[ridx, cidx])
+                a,b = parse_date_range_cell(txt)
+                if a and b:
+                    found_map[int(cidx)] = (txt, a, b)
+                    break
     ordered = [found_map[k] for k in sorted(found_map.keys())] if found_map else []
     if ordered:
         semaines = [it[0] for it in ordered]
@@ -220,35 +355,43 @@ def parse_schedule_sheet(df, sheet_name):
     col_salle = col_form + 1
     col_start = col_salle + 1
 
-    df_data = df.iloc[header_idx+1:].reset_index(drop=True)
+    data = cells[header_idx+1:]
 
     schedule = {}
     groupes = set()
     salles = set()
-    col_map = {}
-    cur = col_start
-    for s in semaines:
-        for j in JOURS:
-            for c in CRENEAUX_JOUR:
-                col_map[f"{s}-{j}-{c}"] = cur
-                cur += 1
-
-    for _, row in df_data.iterrows():
-        form = str(row.iloc[col_form]).strip() if col_form < len(row) else ''
-        salle = str(row.iloc[col_salle]).strip() if col_salle < len(row) else ''
-        if not form or form.lower() in ('nan','none',''):
-            continue
-        schedule.setdefault(form, {'salle': salle, 'slots': {}})
-        if salle and salle.lower() not in ('nan','none',''):
-            salles.add(salle)
-        for key, ci in col_map.items():
-            if ci < len(row):
-                val = row.iloc[ci]
-                if pd.notna(val) and str(val).strip():
-                    grp = str(val).strip()
-                    if grp and not grp.isdigit() and grp.lower() not in ('nan','none'):
-                        schedule[form]['slots'][key] = (grp, salle)
-                        groupes.add(grp)
+    col_map = {
+        slot_key(semaines[s_idx], j, c): col_start + offset
+        for s_idx, j, c, offset in _slot_layout(len(semaines))
+    }
+
+    n_cols = data.shape[1]
+    slot_keys = [k for k, ci in col_map.items() if ci < n_cols]
+    slot_cols = np.fromiter((col_map[k] for k in slot_keys), dtype=np.intp, count=len(slot_keys))
+    # Une seule extraction des cellules de créneaux + masque des cellules non vides
+    slot_block = data[:, slot_cols]
+    filled = pd.notna(slot_block) & (slot_block != '')
+    form_col = data[:, col_form]
+    salle_col = data[:, col_salle] if col_salle < n_cols else np.full(len(data), '', dtype=object)
+
+    # Nettoyage vectorisé: formateurs/salles par ligne, groupes sur les seules cellules remplies
+    forms = np.char.strip(form_col.astype(str))
+    salles_row = np.char.strip(salle_col.astype(str))
+    valid_form = (forms != '') & ~np.isin(np.char.lower(forms), ('nan', 'none'))
+    valid_salle = (salles_row != '') & ~np.isin(np.char.lower(salles_row), ('nan', 'none'))
+    rows_idx, slot_idx = np.nonzero(filled & valid_form[:, None])
+    grps = np.char.strip(slot_block[rows_idx, slot_idx].astype(str))
+    keep = (grps != '') & ~np.char.isdigit(grps) & ~np.isin(np.char.lower(grps), ('nan', 'none'))
+
+    forms = forms.tolist()
+    salles_row = salles_row.tolist()
+    for i in np.flatnonzero(valid_form).tolist():
+        schedule.setdefault(forms[i], {'salle': salles_row[i], 'slots': {}})
+        if valid_salle[i]:
+            salles.add(salles_row[i])
+    for i, k, grp in zip(rows_idx[keep].tolist(), slot_idx[keep].tolist(), grps[keep].tolist()):
+        schedule[forms[i]]['slots'][slot_keys[k]] = (grp, salles_row[i])
+        groupes.add(grp)
 
     return {
         'month': month_label,
@@ -261,17 +404,46 @@ def parse_schedule_sheet(df, sheet_name):
         'header_idx': int(header_idx)
     }
 
-@st.cache_data(show_spinner=False)
-def process_uploaded_excel(uploaded_file):
+def _read_sheet_cells(xls, sheet_name):
+    """Lit un onglet en tableau numpy d'objets, cellules vides remplacées par ''."""
+    df = pd.read_excel(xls, sheet_name=sheet_name, header=None, dtype=str)
+    # Cellules vides remplies directement sur le tableau numpy (pas de second DataFrame)
+    cells = df.to_numpy(dtype=object)
+    cells[pd.isna(cells)] = ''
+    return cells
+
+def file_digest(uploaded_file):
+    """Empreinte courte du contenu d'un fichier importé (clé de cache et détection de changement)."""
+    return hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+
+def process_uploaded_excel(uploaded_file, digest=None):
+    if digest is None:
+        digest = file_digest(uploaded_file)
+    return _process_excel_bytes(digest, uploaded_file.getvalue())
+
+@st.cache_resource(show_spinner=False, max_entries=EXCEL_CACHE_ENTRIES)
+def _process_excel_bytes(digest, _content):
+    # _content n'est pas haché: le cache est indexé par l'empreinte. cache_resource renvoie
+    # l'objet lui-même (ni pickle ni copie); il est en lecture seule, le résolveur copie les slots
     all_data = {}
     try:
-        xls = pd.ExcelFile(uploaded_file)
-        for sheet_name in xls.sheet_names:
-            if sheet_name in IGNORED_SHEETS:
-                continue
-            df = pd.read_excel(xls, sheet_name=sheet_name, header=None, dtype=str)
-            df = df.fillna('')
-            parsed = parse_schedule_sheet(df, sheet_name)
+        xls = pd.ExcelFile(BytesIO(_content), engine=EXCEL_READ_ENGINE)
+        sheet_names = [s for s in xls.sheet_names if s not in IGNORED_SHEETS]
+        n_workers = min(EXCEL_WORKERS, len(sheet_names))
+        if n_workers > 1:
+            # Un lecteur par thread: un ExcelFile ne se partage pas entre threads
+            local = threading.local()
+
+            def parse_one(sheet_name):
+                if not hasattr(local, 'xls'):
+                    local.xls = pd.ExcelFile(BytesIO(_content), engine=EXCEL_READ_ENGINE)
+                return parse_schedule_sheet(_read_sheet_cells(local.xls, sheet_name), sheet_name)
+
+            with ThreadPoolExecutor(max_workers=n_workers) as ex:
+                results = list(ex.map(parse_one, sheet_names))
+        else:
+            results = [parse_schedule_sheet(_read_sheet_cells(xls, s), s) for s in sheet_names]
+        for parsed in results:
             if parsed:
                 all_data[parsed['month']] = parsed
         sorted_data = {m: all_data[m] for m in MONTH_ORDER if m in all_data}
@@ -283,71 +455,121 @@ def process_uploaded_excel(uploaded_file):
         st.error(f"Erreur import: {e}")
         return {}
 
-@st.cache_data(show_spinner=False)
+def _schedule_to_columns(schedule, slot_keys):
+    """Vue colonnes (SoA) d'un planning: matrices groupe/salle indexées [formateur, créneau]."""
+    key_idx = {k: i for i, k in enumerate(slot_keys)}
+    forms = list(schedule.keys())
+    grp = np.full((len(forms), len(slot_keys)), None, dtype=object)
+    salle = np.full((len(forms), len(slot_keys)), '', dtype=object)
+    for fi, form in enumerate(forms):
+        for key, (g, s) in schedule[form]['slots'].items():
+            si = key_idx.get(key)
+            if si is not None:
+                grp[fi, si] = g
+                salle[fi, si] = s
+    return forms, grp, salle
+
 def resolve_salle_conflits(all_data):
-    resolved = copy.deepcopy(all_data)
+    # Pas de st.cache_data: le résultat est conservé dans st.session_state, et la clé de cache
+    # imposerait de hacher tout le classeur analysé puis de repickler le planning résolu
+    # all_data vient de _process_excel_bytes (cache_resource): objet partagé entre toutes les
+    # sessions, à ne jamais modifier. Tout changement passe par la copie ci-dessous.
+    # Copie superficielle: seuls les dicts 'slots' sont réécrits, chaînes et dates sont partagées
+    resolved = {
+        m: {**md, 'schedule': {f: {**fd, 'slots': dict(fd['slots'])} for f, fd in md['schedule'].items()}}
+        for m, md in all_data.items()
+    }
     log = []
     all_salles = set()
     for month in resolved.values():
         all_salles.update(month['salles'])
+    # Salles encodées en entiers (ordre alphabétique = ordre de choix des candidates)
+    salle_names = sorted(all_salles)
+    salle_id = {s: i for i, s in enumerate(salle_names)}
+    # Ensembles de salles en masques de bits (bit i = salle_names[i])
+    banned_mask = 0
+    for i, s in enumerate(salle_names):
+        if any(x in s.lower() for x in ['info','ent']):
+            banned_mask |= 1 << i
+    all_mask = (1 << len(salle_names)) - 1
+    HALF_DAY = [('AM1','AM2'), ('PM1','PM2')]
     for month_name, month_data in resolved.items():
         schedule = month_data['schedule']
         semaines = month_data.get('semaines', FALLBACK_SEMAINES)
-        HALF_DAY = [('AM1','AM2'), ('PM1','PM2')]
+        sem_idx = {s: i for i, s in enumerate(dict.fromkeys(semaines))}
+        slot_keys = [key for s in sem_idx for day_keys in day_slot_keys(s) for key in day_keys]
+        forms, grp, salle = _schedule_to_columns(schedule, slot_keys)
+        n_half = len(slot_keys) // 2
+        # Vues [formateur, demi-journée, créneau 0/1]: demi-journée = (semaine*6 + jour)*2 + AM/PM
+        grp_hd = grp.reshape(len(forms), n_half, 2)
+        has_hd = pd.notna(grp_hd)
+        sal_hd = np.fromiter((salle_id.get(x, -1) for x in salle.ravel()), dtype=np.intp, count=salle.size).reshape(len(forms), n_half, 2)
+        prefs = [schedule[f]['salle'] for f in forms]
+        pref_ids = [salle_id.get(p, -1) for p in prefs]
+        # Index inverse demi-journée -> formateurs occupés, calculé une fois par mois
+        hd_forms = [np.flatnonzero(col).tolist() for col in has_hd.any(axis=2).T]
         for semaine in semaines:
-            for jour in JOURS:
-                for c1, c2 in HALF_DAY:
-                    key1 = f"{semaine}-{jour}-{c1}"
-                    key2 = f"{semaine}-{jour}-{c2}"
-                    occ1 = set()
-                    occ2 = set()
-                    for f, fd in schedule.items():
-                        s1 = fd['slots'].get(key1)
-                        s2 = fd['slots'].get(key2)
-                        if s1 and s1[1]:
-                            occ1.add(s1[1])
-                        if s2 and s2[1]:
-                            occ2.add(s2[1])
-                    libres = all_salles - occ1 - occ2
-                    requests = []
-                    for form, fd in schedule.items():
-                        si1 = fd['slots'].get(key1, (None,None))
-                        si2 = fd['slots'].get(key2, (None,None))
-                        g1, g2 = si1[0], si2[0]
-                        if g1 or g2:
-                            requests.append({'formateur': form, 'g1': g1, 'g2': g2, 'pref': fd['salle']})
-                    occupied = set()
-                    for req in requests:
-                        f = req['formateur']
-                        pref = req['pref']
+            for j_idx, jour in enumerate(JOURS):
+                for h_idx, (c1, c2) in enumerate(HALF_DAY):
+                    hd = (sem_idx[semaine] * len(JOURS) + j_idx) * 2 + h_idx
+                    if not hd_forms[hd]:
+                        continue
+                    key1, key2 = slot_keys[2 * hd], slot_keys[2 * hd + 1]
+                    has = has_hd[:, hd]
+                    # busy = salles exclues (info/ent) + occupées sur l'un des deux créneaux
+                    busy = banned_mask
+                    for sid in np.unique(sal_hd[:, hd][has]).tolist():
+                        if sid >= 0:
+                            busy |= 1 << sid
+                    # occupied: masque des salles connues + noms hors référentiel
+                    occupied_mask = 0
+                    occupied_other = set()
+                    for fi in hd_forms[hd]:
+                        f = forms[fi]
+                        pref = prefs[fi]
+                        pref_id = pref_ids[fi]
+                        g1, g2 = grp_hd[fi, hd]
                         assigned = None
-                        if pref and pref not in occupied:
+                        if pref_id >= 0:
+                            pref_free = not (occupied_mask >> pref_id) & 1
+                        else:
+                            pref_free = pref not in occupied_other
+                        if pref and pref_free:
                             assigned = pref
                         else:
-                            candidates = libres - occupied
-                            candidates = [s for s in candidates if not any(x in s.lower() for x in ['info','ent'])]
-                            if candidates:
-                                candidates.sort()
-                                assigned = candidates[0]
-                                for creneau, grp in [(c1, req['g1']), (c2, req['g2'])]:
-                                    if grp:
-                                        log.append({'Mois': month_name, 'Semaine': semaine, 'Jour_Creneau': f"{jour}-{creneau}", 'Heure': HORAIRES[creneau], 'Formateur': f, 'Groupe': grp, 'Salle_Initiale': pref, 'Salle_Attribuee': assigned})
+                            free = all_mask & ~busy
+                            if free:
+                                assigned = salle_names[(free & -free).bit_length() - 1]
+                                for creneau, grp_name in [(c1, g1), (c2, g2)]:
+                                    if grp_name:
+                                        log.append({'Mois': month_name, 'Semaine': semaine, 'Jour_Creneau': f"{jour}-{creneau}", 'Heure': HORAIRES[creneau], 'Formateur': f, 'Groupe': grp_name, 'Salle_Initiale': pref, 'Salle_Attribuee': assigned})
                             else:
                                 assigned = f"{pref or 'Aucune'} (CONFLIT NON RESOLU)"
-                                for creneau, grp in [(c1, req['g1']), (c2, req['g2'])]:
-                                    if grp:
-                                        log.append({'Mois': month_name, 'Semaine': semaine, 'Jour_Creneau': f"{jour}-{creneau}", 'Heure': HORAIRES[creneau], 'Formateur': f, 'Groupe': grp, 'Salle_Initiale': pref, 'Salle_Attribuee': 'AUCUNE DISPO'})
+                                for creneau, grp_name in [(c1, g1), (c2, g2)]:
+                                    if grp_name:
+                                        log.append({'Mois': month_name, 'Semaine': semaine, 'Jour_Creneau': f"{jour}-{creneau}", 'Heure': HORAIRES[creneau], 'Formateur': f, 'Groupe': grp_name, 'Salle_Initiale': pref, 'Salle_Attribuee': 'AUCUNE DISPO'})
+                        assigned_id = salle_id.get(assigned, -1)
                         if "CONFLIT NON RESOLU" not in assigned:
-                            occupied.add(assigned)
-                        if req['g1']:
-                            resolved[month_name]['schedule'][f]['slots'][key1] = (req['g1'], assigned)
-                        if req['g2']:
-                            resolved[month_name]['schedule'][f]['slots'][key2] = (req['g2'], assigned)
+                            if assigned_id >= 0:
+                                occupied_mask |= 1 << assigned_id
+                                busy |= 1 << assigned_id
+                            else:
+                                occupied_other.add(assigned)
+                        if g1:
+                            schedule[f]['slots'][key1] = (g1, assigned)
+                            sal_hd[fi, hd, 0] = assigned_id
+                        if g2:
+                            schedule[f]['slots'][key2] = (g2, assigned)
+                            sal_hd[fi, hd, 1] = assigned_id
     return resolved, pd.DataFrame(log)
 
 def get_week_start_from_label(mois_label, semaine_label, week_ranges):
     if week_ranges and semaine_label in week_ranges:
         return week_ranges[semaine_label]['start']
+    return _fallback_week_start(mois_label, semaine_label)
+
+@lru_cache(maxsize=256)
+def _fallback_week_start(mois_label, semaine_label):
     mnum = MONTH_TO_NUMBER.get(mois_label)
     if mnum:
         year = 2026 if mnum <= 7 else 2025
@@ -390,84 +612,144 @@ def is_holiday(day_date):
         d = day_date.date()
     else:
         d = day_date
-    for h in HOLIDAYS:
-        if h['date'] == d:
-            return h['label']
-    return None
+    return HOLIDAY_MAP.get(d)
+
+@lru_cache(maxsize=512)
+def week_holiday_labels(week_start):
+    """Libellé férié (ou None) de chaque jour de JOURS pour la semaine débutant à week_start (mémorisé)."""
+    return tuple(is_holiday(day_date(week_start, i)) for i in range(len(JOURS)))
+
+def formateur_week_rows(formateur_data, semaine_label, mois_label, week_ranges):
+    """Grille d'une semaine formateur: [(jour, libellé férié ou None, textes des créneaux ou None)]."""
+    holidays = week_holiday_labels(get_week_start_from_label(mois_label, semaine_label, week_ranges))
+    slots = formateur_data['slots']
+    keys = day_slot_keys(semaine_label)
+    rows = []
+    for j_idx, jour in enumerate(JOURS):
+        if holidays[j_idx]:
+            rows.append((jour, holidays[j_idx], None))
+            continue
+        texts = []
+        for key in keys[j_idx]:
+            grp, salle = slots.get(key, ('',''))
+            texts.append(f"{grp}\n{salle}" if grp and salle else "")
+        rows.append((jour, None, texts))
+    return rows
+
+def _week_rows_to_table(week_rows):
+    """Tableau d'affichage d'une grille semaine (créneaux vides les jours fériés)."""
+    empty = [""] * len(CRENEAUX_JOUR)
+    return pd.DataFrame([[jour] + (texts if texts is not None else empty) for jour, _, texts in week_rows], columns=TABLE_COLUMNS)
 
 def build_schedule_table_for_formateur(formateur_data, semaine_label, mois_label, week_ranges):
-    week_start = get_week_start_from_label(mois_label, semaine_label, week_ranges)
+    return _week_rows_to_table(formateur_week_rows(formateur_data, semaine_label, mois_label, week_ranges))
+
+def build_slot_owners(schedule_data):
+    """Index inverse {créneau: {groupe: texte de cellule "formateur\\nsalle"}}; le premier formateur rencontré l'emporte."""
+    owners = {}
+    for form, fd in schedule_data.items():
+        for key, (grp, salle) in fd['slots'].items():
+            by_grp = owners.setdefault(key, {})
+            if grp not in by_grp:
+                by_grp[grp] = f"{form}\n{salle.replace(' (CONFLIT NON RESOLU)',' (Conflit)')}"
+    return owners
+
+def groupe_week_rows(schedule_data, groupe, semaine_label, mois_label, week_ranges, owners=None):
+    """Grille d'une semaine groupe, même forme que formateur_week_rows."""
+    if owners is None:
+        owners = build_slot_owners(schedule_data)
+    holidays = week_holiday_labels(get_week_start_from_label(mois_label, semaine_label, week_ranges))
+    keys = day_slot_keys(semaine_label)
     rows = []
-    for i, jour in enumerate(JOURS):
-        d = day_date(week_start, i)
-        holiday = is_holiday(d) if d else None
-        row = {'JOUR': jour}
-        for c in CRENEAUX_JOUR:
-            key = f"{semaine_label}-{jour}-{c}"
-            if holiday:
-                row[c] = ""
-            else:
-                slot = formateur_data['slots'].get(key, ('',''))
-                grp, salle = slot
-                row[c] = f"{grp}\n{salle}" if grp and salle else ""
-        rows.append(row)
-    return pd.DataFrame(rows)
-
-def build_schedule_table_for_groupe(schedule_data, groupe, semaine_label, mois_label, week_ranges):
-    week_start = get_week_start_from_label(mois_label, semaine_label, week_ranges)
-    rows = []
-    for i, jour in enumerate(JOURS):
-        d = day_date(week_start, i)
-        holiday = is_holiday(d) if d else None
-        row = {'JOUR': jour}
-        for c in CRENEAUX_JOUR:
-            key = f"{semaine_label}-{jour}-{c}"
-            if holiday:
-                row[c] = ""
-            else:
-                info = ""
-                for form, fd in schedule_data.items():
-                    s = fd['slots'].get(key)
-                    if s and s[0] == groupe:
-                        info = f"{form}\n{s[1].replace(' (CONFLIT NON RESOLU)',' (Conflit)')}"
-                        break
-                row[c] = info
-        rows.append(row)
-    return pd.DataFrame(rows)
+    for j_idx, jour in enumerate(JOURS):
+        if holidays[j_idx]:
+            rows.append((jour, holidays[j_idx], None))
+            continue
+        rows.append((jour, None, [owners.get(key, {}).get(groupe, "") for key in keys[j_idx]]))
+    return rows
+
+def build_schedule_table_for_groupe(schedule_data, groupe, semaine_label, mois_label, week_ranges, owners=None):
+    return _week_rows_to_table(groupe_week_rows(schedule_data, groupe, semaine_label, mois_label, week_ranges, owners))
 
 def compute_hours_for_formateur(formateur_data, semaine_label, mois_label, week_ranges):
     heures = 0.0
-    week_start = get_week_start_from_label(mois_label, semaine_label, week_ranges)
-    for jour_idx, jour in enumerate(JOURS):
-        day_dt = day_date(week_start, jour_idx)
-        if day_dt and is_holiday(day_dt):
+    holidays = week_holiday_labels(get_week_start_from_label(mois_label, semaine_label, week_ranges))
+    keys = day_slot_keys(semaine_label)
+    for jour_idx in range(len(JOURS)):
+        if holidays[jour_idx]:
             continue
-        for c in CRENEAUX_JOUR:
-            slot_key = f"{semaine_label}-{jour}-{c}"
+        for c, slot_key in zip(CRENEAUX_JOUR, keys[jour_idx]):
             if slot_key in formateur_data.get('slots', {}):
                 heures += SLOT_DURATIONS.get(c, 0)
     return heures
 
-def compute_hours_for_groupe(schedule_data, groupe, semaine_label, mois_label, week_ranges):
+def compute_hours_for_groupe(schedule_data, groupe, semaine_label, mois_label, week_ranges, owners=None):
+    if owners is None:
+        owners = build_slot_owners(schedule_data)
     heures = 0.0
-    week_start = get_week_start_from_label(mois_label, semaine_label, week_ranges)
-    for jour_idx, jour in enumerate(JOURS):
-        day_dt = day_date(week_start, jour_idx)
-        if day_dt and is_holiday(day_dt):
+    holidays = week_holiday_labels(get_week_start_from_label(mois_label, semaine_label, week_ranges))
+    keys = day_slot_keys(semaine_label)
+    for jour_idx in range(len(JOURS)):
+        if holidays[jour_idx]:
             continue
-        for c in CRENEAUX_JOUR:
-            slot_key = f"{semaine_label}-{jour}-{c}"
-            for fd in schedule_data.values():
-                slot = fd['slots'].get(slot_key)
-                if slot and slot[0] == groupe:
-                    heures += SLOT_DURATIONS.get(c, 0)
-                    break
+        for c, slot_key in zip(CRENEAUX_JOUR, keys[jour_idx]):
+            if groupe in owners.get(slot_key, ()):
+                heures += SLOT_DURATIONS.get(c, 0)
     return heures
 
+def compute_week_hours(schedule_data, semaine_label, mois_label, week_ranges):
+    """Heures (hors fériés) de tous les formateurs et groupes d'une semaine, en un seul passage."""
+    hours_form = dict.fromkeys(schedule_data, 0.0)
+    hours_grp = {}
+    holidays = week_holiday_labels(get_week_start_from_label(mois_label, semaine_label, week_ranges))
+    keys = day_slot_keys(semaine_label)
+    for jour_idx in range(len(JOURS)):
+        if holidays[jour_idx]:
+            continue
+        for slot_key, duree in zip(keys[jour_idx], SLOT_DURATIONS_ARR):
+            vus = set()
+            for form, fd in schedule_data.items():
+                slot = fd['slots'].get(slot_key)
+                if slot is None:
+                    continue
+                hours_form[form] += duree
+                groupe = slot[0]
+                if groupe not in vus:
+                    vus.add(groupe)
+                    hours_grp[groupe] = hours_grp.get(groupe, 0.0) + duree
+    return hours_form, hours_grp
+
+def build_hours_index(resolved_data):
+    """Précalcule les heures par (mois, semaine) pour tout le classeur après résolution."""
+    index = {}
+    durees = np.array(SLOT_DURATIONS_ARR)
+    for mois, parsed in resolved_data.items():
+        week_ranges = parsed.get('week_ranges', {})
+        semaines = list(dict.fromkeys(parsed.get('semaines', FALLBACK_SEMAINES)))
+        slot_keys = [key for semaine in semaines for day_keys in day_slot_keys(semaine) for key in day_keys]
+        # Vue colonnes du mois: [formateur, semaine, jour, créneau]
+        forms, grp, _ = _schedule_to_columns(parsed['schedule'], slot_keys)
+        grp = grp.reshape(len(forms), len(semaines), len(JOURS), len(CRENEAUX_JOUR))
+        occupied = pd.notna(grp)
+        for s_idx, semaine in enumerate(semaines):
+            holidays = week_holiday_labels(get_week_start_from_label(mois, semaine, week_ranges))
+            ouvres = np.array([not label for label in holidays])
+            week = occupied[:, s_idx] & ouvres[None, :, None]
+            hours_form = dict(zip(forms, (week * durees).sum(axis=(1, 2)).tolist()))
+            hours_grp = {}
+            # Un groupe n'est compté qu'une fois par créneau, même avec plusieurs formateurs
+            for j_idx, c_idx in zip(*np.nonzero(week.any(axis=0))):
+                for groupe in dict.fromkeys(grp[week[:, j_idx, c_idx], s_idx, j_idx, c_idx].tolist()):
+                    hours_grp[groupe] = hours_grp.get(groupe, 0.0) + SLOT_DURATIONS_ARR[c_idx]
+            index[(mois, semaine)] = (hours_form, hours_grp)
+    return index
+
 def add_logo_if_exists(ws, cell='A1'):
     try:
-        if os.path.exists(LOGO_FILE_NAME):
-            img = Image(LOGO_FILE_NAME)
+        logo = _logo_bytes()
+        if logo is not None:
+            # Un flux par image: openpyxl ferme le flux après écriture
+            img = Image(BytesIO(logo))
             img.width = LOGO_WIDTH_PIXELS
             img.height = LOGO_HEIGHT_PIXELS
             ws.add_image(img, cell)
@@ -480,74 +762,114 @@ def excel_to_bytes(wb):
     output.seek(0)
     return output.getvalue()
 
+def conflits_to_bytes(conflits):
+    output = BytesIO()
+    conflits.to_excel(output, index=False, sheet_name='Conflits')
+    return output.getvalue()
+
+def zip_bytes(files):
+    """Archive ZIP en mémoire à partir de paires (nom, octets); un nom en double reçoit un suffixe _1, _2..."""
+    output = BytesIO()
+    used_names = set()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for name, data in files:
+            stem, ext = os.path.splitext(name)
+            unique = name
+            i = 1
+            while unique in used_names:
+                unique = f"{stem}_{i}{ext}"
+                i += 1
+            used_names.add(unique)
+            zf.writestr(unique, data)
+    return output.getvalue()
+
+@lru_cache(maxsize=None)
+def _export_formats():
+    """Formats (font, alignement, bordure) partagés par toutes les cellules des exports."""
+    return {
+        'hdr': (_HEADER_FONT, _CENTER_WRAP, _BORDER_ALL),
+        'jour': (_JOUR_FONT, _CENTER, _BORDER_ALL),
+        'data': (_CELL_FONT, _CENTER_WRAP, _BORDER_ALL),
+        'holiday': (HOLIDAY_FONT, _CENTER, _BORDER_ALL),
+        'border': _BORDER_ALL,
+    }
+
+def _write_row(ws, row_idx, values, fmt, start_col=1):
+    font, align, border = fmt
+    for col, value in enumerate(values, start=start_col):
+        cell = ws.cell(row=row_idx, column=col, value=value)
+        cell.font = font
+        cell.alignment = align
+        cell.border = border
+
+def _write_week_body(ws, start_row, body_rows):
+    """Écrit les lignes JOUR préparées: (jour, libellé férié ou None, textes des créneaux)."""
+    fmt = _export_formats()
+    row = start_row
+    for jour, holiday_label, texts in body_rows:
+        _write_row(ws, row, [jour], fmt['jour'])
+        if holiday_label:
+            ws.merge_cells(start_row=row, start_column=2, end_row=row, end_column=5)
+            _write_row(ws, row, [holiday_label], fmt['holiday'], start_col=2)
+            ws.cell(row=row, column=2).fill = HOLIDAY_FILL
+            for c in range(3, 6):
+                ws.cell(row=row, column=c).border = fmt['border']
+        else:
+            _write_row(ws, row, texts, fmt['data'], start_col=2)
+        ws.row_dimensions[row].height = 28
+        row += 1
+    return row
+
+@lru_cache(maxsize=None)
+def _border_from_sides(left, right, top, bottom):
+    return Border(left=left, right=right, top=top, bottom=bottom)
+
 def clear_row_borders(ws, row_idx, start_col=1, end_col=5):
-    empty_border = Border()
     for c in range(start_col, end_col + 1):
         try:
-            ws.cell(row=row_idx, column=c).border = empty_border
+            ws.cell(row=row_idx, column=c).border = _EMPTY_BORDER
         except Exception:
             pass
 
 def clear_meta_borders(ws, meta_top_row=5, start_col=1, end_col=5):
-    empty_border = Border()
     for r in range(1, meta_top_row + 1):
         for c in range(start_col, end_col + 1):
             try:
-                ws.cell(row=r, column=c).border = empty_border
+                ws.cell(row=r, column=c).border = _EMPTY_BORDER
             except Exception:
                 pass
 
-def find_and_clear_signature_rows(ws, signature_text='Directeur EFP', start_col=1, end_col=5):
-    try:
-        sig_rows = []
-        for r in range(1, ws.max_row + 1):
-            v = ws.cell(row=r, column=1).value
-            if isinstance(v, str) and signature_text.lower() in v.strip().lower():
-                sig_rows.append(r)
-        for r in sig_rows:
-            clear_row_borders(ws, r, start_col, end_col)
-            if r - 1 >= 1:
-                clear_row_borders(ws, r - 1, start_col, end_col)
-    except Exception:
-        pass
-
 def _apply_template_title(ws, title_text, heures_text, periode_text, left_meta, right_meta):
-    center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    title_font = Font(bold=True, size=14, name='Calibri')
-    meta_font_bold = Font(bold=True, size=10, name='Calibri')
     ws.merge_cells('B1:E2')
     ws['B1'] = title_text
-    ws['B1'].font = title_font
-    ws['B1'].alignment = center_align
+    ws['B1'].font = _TITLE_FONT
+    ws['B1'].alignment = _CENTER_WRAP
 
     ws.merge_cells('B3:E3')
     ws['B3'] = heures_text
-    ws['B3'].font = meta_font_bold
-    ws['B3'].alignment = center_align
+    ws['B3'].font = _META_FONT_BOLD
+    ws['B3'].alignment = _CENTER_WRAP
 
     ws.merge_cells('B4:E4')
     ws['B4'] = periode_text
-    ws['B4'].font = meta_font_bold
-    ws['B4'].alignment = center_align
+    ws['B4'].font = _META_FONT_BOLD
+    ws['B4'].alignment = _CENTER_WRAP
 
     for idx, (cell, value) in enumerate(left_meta, start=5):
         ws[cell] = value
-        ws[cell].font = meta_font_bold
-        ws[cell].alignment = Alignment(horizontal='left', vertical='center')
+        ws[cell].font = _META_FONT_BOLD
+        ws[cell].alignment = _LEFT_CENTER
 
     for idx, val in enumerate(right_meta, start=5):
         ws[f'E{idx}'] = val
-        ws[f'E{idx}'].font = meta_font_bold
-        ws[f'E{idx}'].alignment = Alignment(horizontal='right', vertical='center')
+        ws[f'E{idx}'].font = _META_FONT_BOLD
+        ws[f'E{idx}'].alignment = _RIGHT_CENTER
 
 def _draw_table_borders(ws, start_row, end_row, start_col=1, end_col=5, meta_top_row=5):
-    thin_side = Side(style='thin', color='000000')
-    border_all = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
-
     for r in range(start_row, end_row + 1):
         for c in range(start_col, end_col + 1):
             try:
-                ws.cell(row=r, column=c).border = border_all
+                ws.cell(row=r, column=c).border = _BORDER_ALL
             except Exception:
                 pass
 
@@ -555,27 +877,27 @@ def _draw_table_borders(ws, start_row, end_row, start_col=1, end_col=5, meta_top
         left_cell = ws.cell(row=r, column=start_col)
         try:
             existing = left_cell.border
-            left_cell.border = Border(
-                left=thin_side,
-                right=existing.right if existing else thin_side,
-                top=existing.top if existing else thin_side,
-                bottom=existing.bottom if existing else thin_side
+            left_cell.border = _border_from_sides(
+                _THIN,
+                existing.right if existing else _THIN,
+                existing.top if existing else _THIN,
+                existing.bottom if existing else _THIN
             )
         except Exception:
-            left_cell.border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
+            left_cell.border = _BORDER_ALL
 
     for r in range(start_row, end_row + 1):
         right_cell = ws.cell(row=r, column=end_col)
         try:
             existing = right_cell.border
-            right_cell.border = Border(
-                left=existing.left if existing else thin_side,
-                right=thin_side,
-                top=existing.top if existing else thin_side,
-                bottom=existing.bottom if existing else thin_side
+            right_cell.border = _border_from_sides(
+                existing.left if existing else _THIN,
+                _THIN,
+                existing.top if existing else _THIN,
+                existing.bottom if existing else _THIN
             )
         except Exception:
-            right_cell.border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
+            right_cell.border = _BORDER_ALL
 
     try:
         for m in ws.merged_cells.ranges:
@@ -588,130 +910,117 @@ def _draw_table_borders(ws, start_row, end_row, start_col=1, end_col=5, meta_top
                 for rr in range(r1, r2 + 1):
                     for cc in range(c1, c2 + 1):
                         cell = ws.cell(row=rr, column=cc)
-                        cell.border = border_all
-    except Exception:
-        pass
-
-def copy_sheet(ws_src, ws_dest):
-    from openpyxl.cell.cell import MergedCell
-    import copy as _copy
-
-    try:
-        ws_dest.sheet_view.showGridLines = ws_src.sheet_view.showGridLines
+                        cell.border = _BORDER_ALL
     except Exception:
         pass
 
-    try:
-        for merged in ws_src.merged_cells.ranges:
-            ws_dest.merge_cells(str(merged))
-    except Exception:
-        pass
+@lru_cache(maxsize=None)
+def _week_sheet_layout(holiday_days):
+    """Styles, fusions et hauteurs d'une fiche semaine, calculés une fois par motif de jours fériés.
 
-    try:
-        for col_letter, col_dim in ws_src.column_dimensions.items():
-            try:
-                ws_dest.column_dimensions[col_letter].width = col_dim.width
-            except Exception:
-                pass
-    except Exception:
-        pass
-
-    try:
-        for idx, row_dim in ws_src.row_dimensions.items():
-            try:
-                ws_dest.row_dimensions[idx].height = row_dim.height
-            except Exception:
-                pass
-    except Exception:
-        pass
-
-    for row in ws_src.iter_rows():
-        for cell in row:
-            if isinstance(cell, MergedCell):
-                continue
-            new = ws_dest.cell(row=cell.row, column=cell.col_idx, value=cell.value)
-            try:
-                if getattr(cell, "has_style", False):
-                    new.font = _copy.copy(cell.font)
-                    new.border = _copy.copy(cell.border)
-                    new.fill = _copy.copy(cell.fill)
-                    new.number_format = cell.number_format
-                    new.protection = _copy.copy(cell.protection)
-                    new.alignment = _copy.copy(cell.alignment)
-            except Exception:
-                new.value = cell.value
+    La mise en page est appliquée sur une feuille modèle avec les helpers habituels, puis relue
+    pour être rejouée cellule par cellule sur les feuilles en écriture seule (write_only).
+    """
+    ws = openpyxl.Workbook().active
+    _apply_template_title(ws, '', '', '', [(f'A{r}', '') for r in range(5, 9)], [''] * 4)
+    clear_meta_borders(ws, meta_top_row=5, start_col=1, end_col=5)
 
-    try:
-        ws_dest.page_setup.orientation = ws_src.page_setup.orientation
-        ws_dest.page_setup.paperSize = ws_src.page_setup.paperSize
-        ws_dest.page_setup.fitToPage = ws_src.page_setup.fitToPage
-        ws_dest.page_setup.fitToHeight = ws_src.page_setup.fitToHeight
-        ws_dest.page_setup.fitToWidth = ws_src.page_setup.fitToWidth
-    except Exception:
-        pass
+    header_row = 9
+    _write_row(ws, header_row, [''] * (len(CRENEAUX_JOUR) + 1), _export_formats()['hdr'])
+    ws.row_dimensions[header_row].height = 26
 
-    add_logo_if_exists(ws_dest, 'A1')
+    body_rows = [(jour, '-' if ferie else None, [''] * len(CRENEAUX_JOUR)) for jour, ferie in zip(JOURS, holiday_days)]
+    row = _write_week_body(ws, header_row + 1, body_rows)
 
-    header_row = None
-    try:
-        for r in range(1, min(30, ws_dest.max_row) + 1):
-            val = ws_dest.cell(row=r, column=1).value
-            if isinstance(val, str) and val.strip().upper() == 'JOUR':
-                header_row = r
-                break
-    except Exception:
-        header_row = None
+    _draw_table_borders(ws, header_row, row-1, 1, 5, meta_top_row=5)
+    clear_meta_borders(ws, meta_top_row=5, start_col=1, end_col=5)
 
-    if header_row:
-        try:
-            end_row = None
-            for r in range(ws_dest.max_row, header_row - 1, -1):
-                a_val = ws_dest.cell(row=r, column=1).value
-                if (isinstance(a_val, str) and a_val.strip() in JOURS) or any([ws_dest.cell(row=r, column=c).value not in (None, '') for c in range(2,6)]):
-                    end_row = r
-                    break
-            if end_row and end_row >= header_row:
-                _draw_table_borders(ws_dest, header_row, end_row, 1, 5, meta_top_row=5)
-            else:
-                last_row = ws_dest.max_row
-                _draw_table_borders(ws_dest, header_row, last_row, 1, 5, meta_top_row=5)
-        except Exception:
-            pass
+    sig_row = row + 1
+    ws.cell(row=sig_row, column=1).font = _CELL_FONT
+    ws.cell(row=sig_row, column=1).alignment = _LEFT_CENTER
+    clear_row_borders(ws, sig_row - 1, 1, 5)
+    clear_row_borders(ws, sig_row, 1, 5)
+
+    styles = {}
+    for cells in ws.iter_rows():
+        for cell in cells:
+            if cell.has_style:
+                styles[(cell.row, cell.column)] = (_copy(cell.font), _copy(cell.alignment), _copy(cell.border), _copy(cell.fill))
+    return {
+        'styles': styles,
+        'merged': tuple(str(m) for m in ws.merged_cells.ranges),
+        'heights': {r: dim.height for r, dim in ws.row_dimensions.items() if dim.height},
+        'header_row': header_row,
+        'sig_row': sig_row,
+        'max_row': ws.max_row,
+        'max_col': ws.max_column,
+    }
 
-    try:
-        clear_meta_borders(ws_dest, meta_top_row=5, start_col=1, end_col=5)
-    except Exception:
-        pass
-    try:
-        find_and_clear_signature_rows(ws_dest, signature_text='Directeur EFP', start_col=1, end_col=5)
-    except Exception:
-        pass
+def _write_week_sheet(ws, title_text, heures_text, periode_text, left_meta, right_meta, body_rows):
+    """Écrit une fiche semaine complète en flux (feuille write_only) à partir du modèle mis en cache."""
+    layout = _week_sheet_layout(tuple(bool(label) for _, label, _ in body_rows))
+
+    values = {(1, 2): title_text, (3, 2): heures_text, (4, 2): periode_text}
+    for coord, value in left_meta:
+        values[coordinate_to_tuple(coord)] = value
+    for r, value in enumerate(right_meta, start=5):
+        values[(r, 5)] = value
+    header_row = layout['header_row']
+    for c, value in enumerate(HEADER_ROW_TEXTS, start=1):
+        values[(header_row, c)] = value
+    for r, (jour, holiday_label, texts) in enumerate(body_rows, start=header_row + 1):
+        values[(r, 1)] = jour
+        if holiday_label:
+            values[(r, 2)] = holiday_label
+        else:
+            for c, text in enumerate(texts, start=2):
+                values[(r, c)] = text
+    values[(layout['sig_row'], 1)] = 'Directeur EFP'
 
-def create_excel_formateur_semaine(formateur, data, semaine_label, mois_label, week_ranges, niveau="1ère Année", force_25_to_26=True):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    raw_title = f"{formateur[:20]}-{mois_label[:10]}"
-    ws.title = sanitize_sheet_title(raw_title)
     ws.sheet_view.showGridLines = False
-
-    ws.page_setup.orientation = ws.ORIENTATION_LANDSCAPE
-    ws.page_setup.paperSize = ws.PAPERSIZE_A4
+    ws.page_setup.orientation = Worksheet.ORIENTATION_LANDSCAPE
+    ws.page_setup.paperSize = Worksheet.PAPERSIZE_A4
     ws.page_setup.fitToPage = True
     ws.page_setup.fitToHeight = 1
     ws.page_setup.fitToWidth = 1
-
+    ws.column_dimensions['A'].width = 18
+    for col in ['B','C','D','E']:
+        ws.column_dimensions[col].width = 20
+    # Hauteurs et fusions doivent être connues avant l'écriture des lignes
+    for r, height in layout['heights'].items():
+        ws.row_dimensions[r].height = height
+    for rng in layout['merged']:
+        ws.merged_cells.add(rng)
     add_logo_if_exists(ws, 'A1')
 
+    styles = layout['styles']
+    for r in range(1, layout['max_row'] + 1):
+        row_cells = []
+        for c in range(1, layout['max_col'] + 1):
+            style = styles.get((r, c))
+            value = values.get((r, c))
+            if style is None and value is None:
+                row_cells.append(None)
+                continue
+            cell = WriteOnlyCell(ws, value=value)
+            if style is not None:
+                cell.font, cell.alignment, cell.border, cell.fill = style
+            row_cells.append(cell)
+        ws.append(row_cells)
+
+def _periode_text(mois_label, semaine_label, week_ranges):
     try:
         start_dt = get_week_start_from_label(mois_label, semaine_label, week_ranges)
         end_dt = start_dt + timedelta(days=5) if start_dt else None
-        periode_text = f"Date d'application: Du {start_dt.strftime('%d/%m/%Y')} au {end_dt.strftime('%d/%m/%Y')}" if start_dt and end_dt else ""
+        return f"Date d'application: Du {start_dt.strftime('%d/%m/%Y')} au {end_dt.strftime('%d/%m/%Y')}" if start_dt and end_dt else ""
     except Exception:
-        periode_text = ""
+        return ""
 
+def _formateur_sheet_content(formateur, data, semaine_label, mois_label, week_ranges, niveau="1ère Année", force_25_to_26=True, heures=None):
+    """Textes d'une fiche formateur (arguments de _write_week_sheet après la feuille)."""
     title_text = 'EMPLOI DU TEMPS DE FORMATEUR : FORMATION HYBRIDE - V 1.0'
 
-    heures_val_calc = compute_hours_for_formateur(data, semaine_label, mois_label, week_ranges)
+    heures_val_calc = heures if heures is not None else compute_hours_for_formateur(data, semaine_label, mois_label, week_ranges)
     if force_25_to_26 and abs(heures_val_calc - 25.0) < 0.01:
         heures_val = 26.0
     else:
@@ -723,185 +1032,194 @@ def create_excel_formateur_semaine(formateur, data, semaine_label, mois_label, w
                  ('A7', f'Mois: {mois_label}'),
                  ('A8', 'Année de Formation: 2025/2026')]
     right_meta = ['', '', f'Niveau: {niveau}', '']
-    _apply_template_title(ws, title_text, heures_text, periode_text, left_meta, right_meta)
 
-    clear_meta_borders(ws, meta_top_row=5, start_col=1, end_col=5)
+    body_rows = formateur_week_rows(data, semaine_label, mois_label, week_ranges)
 
-    header_row = 9
-    header_font = Font(bold=True, size=10)
-    center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    border_thin = Border(left=Side(style='thin'), right=Side(style='thin'),
-                         top=Side(style='thin'), bottom=Side(style='thin'))
-    headers = ['JOUR'] + [f"{c}\n{HORAIRES[c]}" for c in CRENEAUX_JOUR]
-    for idx, txt in enumerate(headers, start=1):
-        cell = ws.cell(row=header_row, column=idx, value=txt)
-        cell.font = header_font
-        cell.alignment = center_align
-        cell.border = border_thin
-    ws.row_dimensions[header_row].height = 26
+    return title_text, heures_text, _periode_text(mois_label, semaine_label, week_ranges), left_meta, right_meta, body_rows
 
-    row = header_row + 1
-    week_start = get_week_start_from_label(mois_label, semaine_label, week_ranges)
-    for j_idx, jour in enumerate(JOURS):
-        ws.cell(row=row, column=1, value=jour).font = Font(bold=True)
-        ws.cell(row=row, column=1).alignment = Alignment(horizontal='center', vertical='center')
-        ws.cell(row=row, column=1).border = border_thin
-        d = day_date(week_start, j_idx)
-        holiday_label = is_holiday(d) if d else None
-        if holiday_label:
-            ws.merge_cells(start_row=row, start_column=2, end_row=row, end_column=5)
-            cell = ws.cell(row=row, column=2, value=holiday_label)
-            cell.font = HOLIDAY_FONT
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.fill = HOLIDAY_FILL
-            for c in range(2,6):
-                ws.cell(row=row, column=c).border = border_thin
-        else:
-            for ci, creneau in enumerate(CRENEAUX_JOUR, start=2):
-                key = f"{semaine_label}-{jour}-{creneau}"
-                slot = data['slots'].get(key, ('',''))
-                grp, salle = slot
-                text = f"{grp}\n{salle}" if grp and salle else ""
-                cell = ws.cell(row=row, column=ci, value=text)
-                cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                cell.font = Font(size=10, bold=True)
-                cell.border = border_thin
-        ws.row_dimensions[row].height = 28
-        row += 1
-
-    _draw_table_borders(ws, header_row, row-1, 1, 5, meta_top_row=5)
-    clear_meta_borders(ws, meta_top_row=5, start_col=1, end_col=5)
-
-    sig_row = row + 1
-    ws.cell(row=sig_row, column=1, value='Directeur EFP').font = Font(size=10, bold=True)
-    ws.cell(row=sig_row, column=1).alignment = Alignment(horizontal='left', vertical='center')
-    try:
-        clear_row_borders(ws, sig_row - 1, 1, 5)
-    except Exception:
-        pass
-    try:
-        clear_row_borders(ws, sig_row, 1, 5)
-    except Exception:
-        pass
-
-    ws.column_dimensions['A'].width = 18
-    for col in ['B','C','D','E']:
-        ws.column_dimensions[col].width = 20
+def _prepare_in_threads(fn, items):
+    """fn appliquée à chaque élément (ordre conservé), sur plusieurs threads si la machine le permet."""
+    n_workers = min(EXCEL_WORKERS, len(items))
+    if n_workers > 1:
+        with ThreadPoolExecutor(max_workers=n_workers) as ex:
+            return list(ex.map(fn, items))
+    return [fn(item) for item in items]
 
+def create_excel_formateur_semaine(formateur, data, semaine_label, mois_label, week_ranges, niveau="1ère Année", force_25_to_26=True, heures=None, ws=None):
+    if ws is None:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=sanitize_sheet_title(f"{formateur[:20]}-{mois_label[:10]}"))
+    else:
+        wb = ws.parent
+    _write_week_sheet(ws, *_formateur_sheet_content(formateur, data, semaine_label, mois_label, week_ranges, niveau, force_25_to_26, heures))
     return wb
 
-def create_excel_groupe_semaine(groupe, schedule_data, semaine_label, mois_label, week_ranges, niveau="1ère Année"):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    raw_title = f"{groupe[:20]}-{mois_label[:10]}"
-    ws.title = sanitize_sheet_title(raw_title)
-    ws.sheet_view.showGridLines = False
-
-    ws.page_setup.orientation = ws.ORIENTATION_LANDSCAPE
-    ws.page_setup.paperSize = ws.PAPERSIZE_A4
-    ws.page_setup.fitToPage = True
-    ws.page_setup.fitToHeight = 1
-    ws.page_setup.fitToWidth = 1
-
-    add_logo_if_exists(ws, 'A1')
-
-    try:
-        start_dt = get_week_start_from_label(mois_label, semaine_label, week_ranges)
-        end_dt = start_dt + timedelta(days=5) if start_dt else None
-        periode_text = f"Date d'application: Du {start_dt.strftime('%d/%m/%Y')} au {end_dt.strftime('%d/%m/%Y')}" if start_dt and end_dt else ""
-    except Exception:
-        periode_text = ""
-
+def _groupe_sheet_content(groupe, schedule_data, semaine_label, mois_label, week_ranges, niveau="1ère Année", heures=None, owners=None):
+    """Textes d'une fiche groupe (arguments de _write_week_sheet après la feuille)."""
+    if owners is None:
+        owners = build_slot_owners(schedule_data)
     title_text = 'EMPLOI DU TEMPS PAR GROUPE : FORMATION HYBRIDE - V 1.0'
-    heures_val = compute_hours_for_groupe(schedule_data, groupe, semaine_label, mois_label, week_ranges)
+    heures_val = heures if heures is not None else compute_hours_for_groupe(schedule_data, groupe, semaine_label, mois_label, week_ranges, owners)
     heures_text = f'MASSE HORAIRE: {heures_val:.1f}H/SEMAINE'
     left_meta = [('A5', 'CFP TLRA/IFMLT'),
                  ('A6', f'Groupe: {groupe}'),
                  ('A7', f'Mois: {mois_label}'),
                  ('A8', 'Année de Formation: 2025/2026')]
     right_meta = ['', '', f'Niveau: {niveau}', '']
-    _apply_template_title(ws, title_text, heures_text, periode_text, left_meta, right_meta)
 
-    clear_meta_borders(ws, meta_top_row=5, start_col=1, end_col=5)
+    body_rows = groupe_week_rows(schedule_data, groupe, semaine_label, mois_label, week_ranges, owners)
 
-    header_row = 9
-    header_font = Font(bold=True, size=10)
-    center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    border_thin = Border(left=Side(style='thin'), right=Side(style='thin'),
-                         top=Side(style='thin'), bottom=Side(style='thin'))
-    headers = ['JOUR'] + [f"{c}\n{HORAIRES[c]}" for c in CRENEAUX_JOUR]
-    for idx, txt in enumerate(headers, start=1):
-        cell = ws.cell(row=header_row, column=idx, value=txt)
-        cell.font = header_font
-        cell.alignment = center_align
-        cell.border = border_thin
-    ws.row_dimensions[header_row].height = 26
+    return title_text, heures_text, _periode_text(mois_label, semaine_label, week_ranges), left_meta, right_meta, body_rows
 
-    row = header_row + 1
-    week_start = get_week_start_from_label(mois_label, semaine_label, week_ranges)
-    for j_idx, jour in enumerate(JOURS):
-        ws.cell(row=row, column=1, value=jour).font = Font(bold=True)
-        ws.cell(row=row, column=1).alignment = Alignment(horizontal='center', vertical='center')
-        d = day_date(week_start, j_idx)
-        holiday_label = is_holiday(d) if d else None
-        if holiday_label:
-            ws.merge_cells(start_row=row, start_column=2, end_row=row, end_column=5)
-            cell = ws.cell(row=row, column=2, value=holiday_label)
-            cell.font = HOLIDAY_FONT
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.fill = HOLIDAY_FILL
-            for c in range(2,6):
-                ws.cell(row=row, column=c).border = border_thin
-        else:
-            for ci, creneau in enumerate(CRENEAUX_JOUR, start=2):
-                key = f"{semaine_label}-{jour}-{creneau}"
-                info = ""
-                for f, fd in schedule_data.items():
-                    s = fd['slots'].get(key)
-                    if s and s[0] == groupe:
-                        info = f"{f}\n{s[1].replace(' (CONFLIT NON RESOLU)',' (Conflit)')}"
-                        break
-                cell = ws.cell(row=row, column=ci, value=info)
-                cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                cell.font = Font(size=10, bold=True)
-                cell.border = border_thin
-        ws.row_dimensions[row].height = 28
-        row += 1
+def create_excel_groupe_semaine(groupe, schedule_data, semaine_label, mois_label, week_ranges, niveau="1ère Année", heures=None, ws=None, owners=None):
+    if ws is None:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=sanitize_sheet_title(f"{groupe[:20]}-{mois_label[:10]}"))
+    else:
+        wb = ws.parent
+    _write_week_sheet(ws, *_groupe_sheet_content(groupe, schedule_data, semaine_label, mois_label, week_ranges, niveau, heures, owners))
+    return wb
 
-    _draw_table_borders(ws, header_row, row-1, 1, 5, meta_top_row=5)
-    clear_meta_borders(ws, meta_top_row=5, start_col=1, end_col=5)
+def create_excel_pack(items, sheet_content, mois_label):
+    """Classeur pack: une feuille par élément, textes préparés en parallèle et feuilles écrites en série."""
+    wb = openpyxl.Workbook(write_only=True)
+    used_names = set()
+    for item, content in zip(items, _prepare_in_threads(sheet_content, items)):
+        sheet_base = sanitize_sheet_title(f"{item[:25]}_{mois_label}", max_len=31)
+        sheet_name = sheet_base
+        i = 1
+        while sheet_name in used_names:
+            suffix = f"_{i}"
+            sheet_name = sanitize_sheet_title(sheet_base[:31-len(suffix)] + suffix)
+            i += 1
+        used_names.add(sheet_name)
+        _write_week_sheet(wb.create_sheet(title=sheet_name), *content)
+    return wb
 
-    sig_row = row + 1
-    ws.cell(row=sig_row, column=1, value='Directeur EFP').font = Font(size=10, bold=True)
-    ws.cell(row=sig_row, column=1).alignment = Alignment(horizontal='left', vertical='center')
-    try:
-        clear_row_borders(ws, sig_row - 1, 1, 5)
-    except Exception:
-        pass
-    try:
-        clear_row_borders(ws, sig_row, 1, 5)
-    except Exception:
-        pass
+def _reset_pack_selection():
+    st.session_state['pack_selection'] = {}
+    for key in [k for k in st.session_state if k.startswith(('pack_formateurs_', 'pack_groupes_'))]:
+        del st.session_state[key]
+
+def _save_pack_selection(key):
+    st.session_state['pack_selection'][key] = st.session_state[key]
+
+def pack_multiselect(label, kind, mois, options):
+    """Liste du pack à clé stable (toutes les entrées au départ); la sélection survit au masquage de la liste."""
+    key = f"pack_{kind}_{mois}"
+    # Widget masqué: Streamlit oublie sa valeur, reprise depuis la copie enregistrée par on_change
+    valides = set(options)
+    initiale = st.session_state[key] if key in st.session_state else st.session_state['pack_selection'].get(key, options)
+    st.session_state[key] = [o for o in initiale if o in valides]
+    return st.multiselect(label, options, key=key, on_change=_save_pack_selection, args=(key,))
+
+def build_charge_groupes(groupes, owners, week_slot_keys, titre):
+    """Analyse de charge d'une semaine: (df trié et catégorisé, moyenne, seuil bas, seuil haut, figure), ou None sans groupe."""
+    # Un seul passage sur les créneaux de la semaine: (heures, nb créneaux) par groupe
+    charge = {}
+    for _, _, c_idx, _, slot_key in week_slot_keys:
+        for groupe in owners.get(slot_key, ()):
+            heures_total, nb_creneaux = charge.get(groupe, (0, 0))
+            charge[groupe] = (heures_total + SLOT_DURATIONS_ARR[c_idx], nb_creneaux + 1)
+    charge_groupes = []
+    for groupe in groupes:
+        heures_total, nb_creneaux = charge.get(groupe, (0, 0))
+        charge_groupes.append({'Groupe': groupe, 'Heures de Formation': heures_total, 'Nombre de Créneaux': nb_creneaux})
+    if not charge_groupes:
+        return None
 
-    ws.column_dimensions['A'].width = 18
-    for col in ['B','C','D','E']:
-        ws.column_dimensions[col].width = 20
+    df_charge = pd.DataFrame(charge_groupes).sort_values('Heures de Formation', ascending=False)
+    moyenne_heures = df_charge['Heures de Formation'].mean()
+    seuil_bas = moyenne_heures * 0.85
+    seuil_haut = moyenne_heures * 1.15
+
+    h = df_charge['Heures de Formation'].to_numpy()
+    niveaux = [h > seuil_haut, h >= seuil_bas]
+    # Au-delà du plafond, le graphique ne garde que les groupes les plus et les moins chargés
+    if len(df_charge) > CHARGE_PLOT_MAX_GROUPES:
+        moitie = CHARGE_PLOT_MAX_GROUPES // 2
+        fig = build_charge_figure(pd.concat([df_charge.head(moitie), df_charge.tail(moitie)]), moyenne_heures, seuil_bas, seuil_haut,
+                                  f'{titre} ({moitie} plus et {moitie} moins chargés sur {len(df_charge)})')
+    else:
+        fig = build_charge_figure(df_charge, moyenne_heures, seuil_bas, seuil_haut, titre)
 
+    df_charge['Catégorie'] = np.select(niveaux, ["🔴 Trop Chargé", "🟡 Chargé"], default="🟢 Normal")
+    # Écart gardé numérique (colonne Arrow typée); mis en forme à l'affichage et à l'export
+    df_charge['Écart/Moyenne'] = df_charge['Heures de Formation'] - moyenne_heures
+    return df_charge, moyenne_heures, seuil_bas, seuil_haut, fig
+
+def build_charge_figure(df_plot, moyenne_heures, seuil_bas, seuil_haut, titre):
+    if go is None:
+        return None
+    h = df_plot['Heures de Formation'].to_numpy()
+    colors = np.select([h > seuil_haut, h >= seuil_bas], ['#d32f2f', '#fbc02d'], default='#388e3c').tolist()
+    fig = go.Figure(data=[go.Bar(x=df_plot['Groupe'], y=df_plot['Heures de Formation'], text=df_plot['Heures de Formation'].apply(lambda x: f"{x:.1f}h"), textposition='outside', marker=dict(color=colors, line=dict(color='#1e5631', width=1.5)), hovertemplate='<b>%{x}</b><br>Heures: %{y:.1f}h<br><extra></extra>')])
+    fig.add_hline(y=moyenne_heures, line_dash="dash", line_color="#1e5631", annotation_text=f"Moyenne: {moyenne_heures:.1f}h", annotation_position="right")
+    fig.add_hline(y=seuil_haut, line_dash="dot", line_color="#d32f2f", opacity=0.5)
+    fig.add_hline(y=seuil_bas, line_dash="dot", line_color="#388e3c", opacity=0.5)
+    fig.update_layout(title={'text': f'Charge Horaire par Groupe - {titre}', 'x': 0.5}, xaxis_title='Groupes', yaxis_title='Heures de Formation', plot_bgcolor='white', paper_bgcolor='#f8faf9', height=500, showlegend=False, xaxis=dict(tickangle=-45, gridcolor='lightgray'), yaxis=dict(gridcolor='lightgray'))
+    return fig
+
+def create_excel_charge_groupes(df_charge, moyenne_heures, seuil_bas, seuil_haut, titre):
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=sanitize_sheet_title("Charge_Groupes"))
+    ws.sheet_view.showGridLines = False
+    for col in range(1, len(CHARGE_EXPORT_HEADERS) + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 25
+    ws.row_dimensions[1].height = 25
+    ws.row_dimensions[2].height = 20
+    ws.merged_cells.add('A1:E1')
+    ws.merged_cells.add('A2:E2')
+
+    def styled(value, font=None, fill=None, border=None):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.alignment = _CENTER_WRAP
+        if font is not None:
+            cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if border is not None:
+            cell.border = border
+        return cell
+
+    ws.append([styled(f'ANALYSE DE CHARGE PAR GROUPE - {titre}', font=_CHARGE_TITLE_FONT)])
+    ws.append([styled(f'Moyenne: {moyenne_heures:.1f}h | Seuils: Normal < {seuil_bas:.1f}h | Chargé: {seuil_bas:.1f}h-{seuil_haut:.1f}h | Trop Chargé > {seuil_haut:.1f}h')])
+    ws.append([])
+    ws.append([styled(entete, font=_CHARGE_HEADER_FONT, fill=_CHARGE_HEADER_FILL, border=_CHARGE_BORDER) for entete in CHARGE_EXPORT_HEADERS])
+    for groupe, heures, nb_creneaux, categorie, ecart in df_charge[list(CHARGE_EXPORT_COLUMNS)].itertuples(index=False, name=None):
+        ws.append([styled(value, border=_CHARGE_BORDER) for value in (groupe, heures, nb_creneaux, categorie, f"{ecart:+.1f}h")])
     return wb
 
-@st.cache_data(show_spinner=False)
-def get_available_salles(resolved_schedule, all_salles, semaine_label, jour, creneau):
+def build_salles_libres(salles, occupancy, week_slot_keys, week_holidays):
+    """Synthèse des salles libres d'une semaine: une ligne par (jour, créneau)."""
+    # Tri unique; chaque créneau filtre la liste triée sans la retrier
+    toutes = sorted(set(salles))
+    synth = []
+    for j_idx, jour, _, c, key in week_slot_keys:
+        occ = set() if week_holidays[j_idx] else occupancy.get(key, (set(), set()))[1]
+        libres = [salle for salle in toutes if salle not in occ]
+        synth.append({'Jour': jour, 'Créneau': c, 'Horaire': HORAIRES[c], 'Nb Salles Libres': len(libres), 'Salles Disponibles': ', '.join(libres) if libres else 'Aucune'})
+    return pd.DataFrame(synth)
+
+def build_salle_occupancy(schedule_data):
+    """Salles par créneau: {clé: (salles attribuées hors conflit, salles citées y compris en conflit)}."""
+    occupancy = {}
+    for fd in schedule_data.values():
+        for key, (grp, salle) in fd['slots'].items():
+            attribuees, citees = occupancy.setdefault(key, (set(), set()))
+            if "CONFLIT NON RESOLU" not in salle:
+                attribuees.add(salle)
+            if grp:
+                citees.add(salle.replace(' (CONFLIT NON RESOLU)','').replace(' (Conflit)',''))
+    return occupancy
+
+def get_available_salles(resolved_schedule, all_salles, semaine_label, jour, creneau, occupancy=None):
     if not all_salles:
         return []
-    slot_key = f"{semaine_label}-{jour}-{creneau}"
-    occ = set()
-    for fdata in resolved_schedule.values():
-        slot = fdata['slots'].get(slot_key)
-        if slot:
-            s = slot[1]
-            if "CONFLIT NON RESOLU" not in s:
-                occ.add(s)
-    return sorted(list(set(all_salles) - occ))
+    if occupancy is None:
+        occupancy = build_salle_occupancy(resolved_schedule)
+    occ = occupancy.get(slot_key(semaine_label, jour, creneau), (set(), set()))[0]
+    return sorted(set(all_salles) - occ)
 
 # --- SIDEBAR: Upload & processing ---
 with st.sidebar:
@@ -918,15 +1236,26 @@ with st.sidebar:
     st.checkbox("Activer règle 25h -> 26h (masse horaire statutaire)", value=st.session_state['force_25_to_26'], key="force_25_to_26", help="Si coché, toute masse horaire calculée à 25.0 sera remplacée par 26.0 sur les exports formateur.")
 
     if uploaded_file:
-        if st.session_state['raw_data'] is None or uploaded_file != st.session_state.get('uploaded_file_ref'):
+        digest = file_digest(uploaded_file)
+        if st.session_state['raw_data'] is None or digest != st.session_state.get('uploaded_file_digest'):
             with st.spinner("Analyse et résolution des conflits..."):
-                st.session_state['raw_data'] = process_uploaded_excel(uploaded_file)
-                st.session_state['uploaded_file_ref'] = uploaded_file
+                st.session_state['raw_data'] = process_uploaded_excel(uploaded_file, digest)
+                st.session_state['uploaded_file_digest'] = digest
                 if st.session_state['raw_data']:
                     st.session_state['resolved_data'], st.session_state['conflits_log'] = resolve_salle_conflits(st.session_state['raw_data'])
+                    st.session_state['hours_index'] = build_hours_index(st.session_state['resolved_data'])
+                    st.session_state['slot_owners'] = {m: build_slot_owners(md['schedule']) for m, md in st.session_state['resolved_data'].items()}
+                    st.session_state['salle_occupancy'] = {m: build_salle_occupancy(md['schedule']) for m, md in st.session_state['resolved_data'].items()}
+                    st.session_state['week_cache'] = {}
+                    _reset_pack_selection()
                 else:
                     st.session_state['resolved_data'] = None
                     st.session_state['conflits_log'] = pd.DataFrame()
+                    st.session_state['hours_index'] = {}
+                    st.session_state['slot_owners'] = {}
+                    st.session_state['salle_occupancy'] = {}
+                    st.session_state['week_cache'] = {}
+                    _reset_pack_selection()
                 if st.session_state['resolved_data']:
                     st.success(f"✅ {len(st.session_state['resolved_data'])} mois chargés et conflits traités")
                     for month in st.session_state['resolved_data'].keys():
@@ -996,11 +1325,34 @@ else:
 
     week_ranges = parsed.get('week_ranges', {})
 
+    # Clés de créneaux de la semaine sélectionnée, calculées une seule fois par rerun
+    day_keys = day_slot_keys(selected_semaine)
+    week_slot_keys = tuple(
+        (j_idx, jour, c_idx, creneau, day_keys[j_idx][c_idx])
+        for j_idx, jour in enumerate(JOURS)
+        for c_idx, creneau in enumerate(CRENEAUX_JOUR)
+    )
+
+    # Heures de la semaine précalculées à l'import (recalcul si absentes de la session)
+    week_hours = st.session_state.get('hours_index', {}).get((selected_month, selected_semaine))
+    if week_hours is None:
+        week_hours = compute_week_hours(parsed['schedule'], selected_semaine, selected_month, week_ranges)
+    hours_form, hours_grp = week_hours
+    owners = st.session_state.get('slot_owners', {}).get(selected_month)
+    if owners is None:
+        owners = build_slot_owners(parsed['schedule'])
+    occupancy = st.session_state.get('salle_occupancy', {}).get(selected_month)
+    if occupancy is None:
+        occupancy = build_salle_occupancy(parsed['schedule'])
+
     week_start = get_week_start_from_label(selected_month, selected_semaine, week_ranges)
+    week_holidays = week_holiday_labels(week_start)
+    # Vues agrégées (tab4, tab5) conservées par (vue, mois, semaine) jusqu'au prochain chargement de fichier
+    week_cache = st.session_state['week_cache']
     holidays_week = []
     for i, jour in enumerate(JOURS):
         d = day_date(week_start, i)
-        lbl = is_holiday(d) if d else None
+        lbl = week_holidays[i]
         if lbl:
             holidays_week.append({'jour': jour, 'date': d.strftime('%d/%m/%Y') if d else '', 'label': lbl})
     if holidays_week:
@@ -1028,7 +1380,7 @@ else:
             fdata = parsed['schedule'][selected_form]
             df_view = build_schedule_table_for_formateur(fdata, selected_semaine, selected_month, week_ranges)
             st.dataframe(df_view, use_container_width=True)
-            heures_calc = compute_hours_for_formateur(fdata, selected_semaine, selected_month, week_ranges)
+            heures_calc = hours_form.get(selected_form, 0.0)
             if st.session_state.get('force_25_to_26', True) and abs(heures_calc - 25.0) < 0.01:
                 heures_display = 26.0
             else:
@@ -1040,66 +1392,73 @@ else:
                 st.metric("Heures (hors fériés)", f"{heures_display:.2f}h")
             st.markdown("### 📄 Export Excel")
             if st.button("📥 Générer Excel (Formateur)", key="btn_export_form"):
-                wb = create_excel_formateur_semaine(selected_form, fdata, selected_semaine, selected_month, week_ranges, niveau=st.session_state.get('niveau_global','1ère Année'), force_25_to_26=st.session_state.get('force_25_to_26', True))
+                wb = create_excel_formateur_semaine(selected_form, fdata, selected_semaine, selected_month, week_ranges, niveau=st.session_state.get('niveau_global','1ère Année'), force_25_to_26=st.session_state.get('force_25_to_26', True), heures=heures_calc)
                 filename = sanitize_sheet_title(f"EDT_Formateur_{selected_form}_{selected_month}", max_len=80) + ".xlsx"
                 st.download_button("💾 Télécharger Excel", excel_to_bytes(wb), filename)
 
         st.markdown("---")
-        if st.button("📥 Générer Pack Excel (Tous les formateurs)"):
+        pack_forms = parsed['formateurs']
+        pack_tous_forms = st.checkbox("Pack: tous les formateurs", value=True, key="pack_form_tous")
+        if not pack_tous_forms:
+            pack_forms = pack_multiselect("Formateurs à inclure dans le pack", 'formateurs', selected_month, parsed['formateurs'])
+        if st.button("📥 Générer Pack Excel (Tous les formateurs)" if pack_tous_forms else "📥 Générer Pack Excel (formateurs sélectionnés)", disabled=not pack_forms):
             with st.spinner("Génération pack..."):
-                wb_final = openpyxl.Workbook()
-                wb_final.remove(wb_final.active)
-                used_names = set()
-                for form in parsed['formateurs']:
-                    wb_temp = create_excel_formateur_semaine(form, parsed['schedule'][form], selected_semaine, selected_month, week_ranges, niveau=st.session_state.get('niveau_global','1ère Année'), force_25_to_26=st.session_state.get('force_25_to_26', True))
-                    ws_temp = wb_temp.active
-                    sheet_base = sanitize_sheet_title(f"{form[:25]}_{selected_month}", max_len=31)
-                    sheet_name = sheet_base
-                    i = 1
-                    while sheet_name in used_names:
-                        suffix = f"_{i}"
-                        sheet_name = sanitize_sheet_title(sheet_base[:31-len(suffix)] + suffix)
-                        i += 1
-                    used_names.add(sheet_name)
-                    ws_new = wb_final.create_sheet(title=sheet_name)
-                    copy_sheet(ws_temp, ws_new)
+                niveau = st.session_state.get('niveau_global','1ère Année')
+                force_25 = st.session_state.get('force_25_to_26', True)
+                wb_final = create_excel_pack(
+                    pack_forms,
+                    lambda form: _formateur_sheet_content(form, parsed['schedule'][form], selected_semaine, selected_month, week_ranges, niveau=niveau, force_25_to_26=force_25, heures=hours_form.get(form, 0.0)),
+                    selected_month)
                 filename = sanitize_sheet_title(f"Pack_Formateurs_{selected_month}", max_len=80) + ".xlsx"
                 st.download_button("💾 Télécharger Pack Excel (Formateurs)", excel_to_bytes(wb_final), filename)
+        if st.button("📦 Générer Pack ZIP (un fichier par formateur)", disabled=not pack_forms):
+            with st.spinner("Génération pack..."):
+                niveau = st.session_state.get('niveau_global','1ère Année')
+                force_25 = st.session_state.get('force_25_to_26', True)
+                # Un classeur indépendant par formateur: construction complète en parallèle
+                files = _prepare_in_threads(
+                    lambda form: (sanitize_sheet_title(f"EDT_Formateur_{form}_{selected_month}", max_len=80) + ".xlsx",
+                                  excel_to_bytes(create_excel_formateur_semaine(form, parsed['schedule'][form], selected_semaine, selected_month, week_ranges, niveau=niveau, force_25_to_26=force_25, heures=hours_form.get(form, 0.0)))),
+                    pack_forms)
+                filename = sanitize_sheet_title(f"Pack_Formateurs_{selected_month}", max_len=80) + ".zip"
+                st.download_button("💾 Télécharger Pack ZIP (Formateurs)", zip_bytes(files), filename, "application/zip")
 
     with tab2:
         st.markdown('<div class="section-header">📚 Consultation / Export par Groupe</div>', unsafe_allow_html=True)
         selected_grp = st.selectbox("Sélectionner un groupe", parsed['groupes'], key="ui_grp")
         if selected_grp:
-            df_grp = build_schedule_table_for_groupe(parsed['schedule'], selected_grp, selected_semaine, selected_month, week_ranges)
+            df_grp = build_schedule_table_for_groupe(parsed['schedule'], selected_grp, selected_semaine, selected_month, week_ranges, owners=owners)
             st.dataframe(df_grp, use_container_width=True)
-            heures_g = compute_hours_for_groupe(parsed['schedule'], selected_grp, selected_semaine, selected_month, week_ranges)
+            heures_g = hours_grp.get(selected_grp, 0.0)
             st.metric("Heures (hors fériés)", f"{heures_g:.2f}h")
             if st.button("📥 Générer Excel (Groupe)"):
-                wb = create_excel_groupe_semaine(selected_grp, parsed['schedule'], selected_semaine, selected_month, week_ranges, niveau=st.session_state.get('niveau_global','1ère Année'))
+                wb = create_excel_groupe_semaine(selected_grp, parsed['schedule'], selected_semaine, selected_month, week_ranges, niveau=st.session_state.get('niveau_global','1ère Année'), heures=heures_g, owners=owners)
                 filename = sanitize_sheet_title(f"EDT_Groupe_{selected_grp}_{selected_month}", max_len=80) + ".xlsx"
                 st.download_button("💾 Télécharger Excel", excel_to_bytes(wb), filename)
 
         st.markdown("---")
-        if st.button("📥 Générer Pack Excel (Tous les groupes)"):
+        pack_grps = parsed['groupes']
+        pack_tous_grps = st.checkbox("Pack: tous les groupes", value=True, key="pack_grp_tous")
+        if not pack_tous_grps:
+            pack_grps = pack_multiselect("Groupes à inclure dans le pack", 'groupes', selected_month, parsed['groupes'])
+        if st.button("📥 Générer Pack Excel (Tous les groupes)" if pack_tous_grps else "📥 Générer Pack Excel (groupes sélectionnés)", disabled=not pack_grps):
             with st.spinner("Génération pack..."):
-                wb_final = openpyxl.Workbook()
-                wb_final.remove(wb_final.active)
-                used_names = set()
-                for groupe in parsed['groupes']:
-                    wb_temp = create_excel_groupe_semaine(groupe, parsed['schedule'], selected_semaine, selected_month, week_ranges, niveau=st.session_state.get('niveau_global','1ère Année'))
-                    ws_temp = wb_temp.active
-                    sheet_base = sanitize_sheet_title(f"{groupe[:25]}_{selected_month}", max_len=31)
-                    sheet_name = sheet_base
-                    i = 1
-                    while sheet_name in used_names:
-                        suffix = f"_{i}"
-                        sheet_name = sanitize_sheet_title(sheet_base[:31-len(suffix)] + suffix)
-                        i += 1
-                    used_names.add(sheet_name)
-                    ws_new = wb_final.create_sheet(title=sheet_name)
-                    copy_sheet(ws_temp, ws_new)
+                niveau = st.session_state.get('niveau_global','1ère Année')
+                wb_final = create_excel_pack(
+                    pack_grps,
+                    lambda groupe: _groupe_sheet_content(groupe, parsed['schedule'], selected_semaine, selected_month, week_ranges, niveau=niveau, heures=hours_grp.get(groupe, 0.0), owners=owners),
+                    selected_month)
                 filename = sanitize_sheet_title(f"Pack_Groupes_{selected_month}", max_len=80) + ".xlsx"
                 st.download_button("💾 Télécharger Pack Excel (Groupes)", excel_to_bytes(wb_final), filename)
+        if st.button("📦 Générer Pack ZIP (un fichier par groupe)", disabled=not pack_grps):
+            with st.spinner("Génération pack..."):
+                niveau = st.session_state.get('niveau_global','1ère Année')
+                files = _prepare_in_threads(
+                    lambda groupe: (sanitize_sheet_title(f"EDT_Groupe_{groupe}_{selected_month}", max_len=80) + ".xlsx",
+                                    excel_to_bytes(create_excel_groupe_semaine(groupe, parsed['schedule'], selected_semaine, selected_month, week_ranges, niveau=niveau, heures=hours_grp.get(groupe, 0.0), owners=owners))),
+                    pack_grps)
+                filename = sanitize_sheet_title(f"Pack_Groupes_{selected_month}", max_len=80) + ".zip"
+                st.download_button("💾 Télécharger Pack ZIP (Groupes)", zip_bytes(files), filename, "application/zip")
 
     with tab3:
         st.markdown('<div class="section-header">🚪 Salles & Conflits</div>', unsafe_allow_html=True)
@@ -1108,7 +1467,7 @@ else:
             sel_jour = st.selectbox("Jour", JOURS, key="salle_jour")
         with colc:
             sel_cr = st.selectbox("Créneau", CRENEAUX_JOUR, key="salle_cr")
-        salles_libres = get_available_salles(parsed['schedule'], parsed['salles'], selected_semaine, sel_jour, sel_cr) if sel_jour and sel_cr else []
+        salles_libres = get_available_salles(parsed['schedule'], parsed['salles'], selected_semaine, sel_jour, sel_cr, occupancy=occupancy) if sel_jour and sel_cr else []
         st.metric("Salles disponibles", len(salles_libres))
         if salles_libres:
             st.write(", ".join(salles_libres))
@@ -1119,144 +1478,78 @@ else:
         if conflits.empty:
             st.info("Aucun conflit détecté.")
         else:
-            cs = conflits[(conflits['Mois']==selected_month) & (conflits['Semaine']==selected_semaine)]
+            # Filtre et fichier Excel de la semaine calculés une fois, pas à chaque interaction
+            conflits_key = ('conflits', selected_month, selected_semaine)
+            if conflits_key not in week_cache:
+                cs = conflits[(conflits['Mois']==selected_month) & (conflits['Semaine']==selected_semaine)]
+                week_cache[conflits_key] = (cs, None if cs.empty else conflits_to_bytes(cs))
+            cs, cs_bytes = week_cache[conflits_key]
             st.dataframe(cs, use_container_width=True)
-            if not cs.empty:
-                b = BytesIO()
-                cs.to_excel(b, index=False, sheet_name='Conflits')
-                b.seek(0)
-                st.download_button("📥 Télécharger Conflits", b.getvalue(), f"Conflits_{selected_month}_{selected_semaine}.xlsx")
+            if cs_bytes is not None:
+                st.download_button("📥 Télécharger Conflits", cs_bytes, f"Conflits_{selected_month}_{selected_semaine}.xlsx")
 
     with tab4:
         st.markdown('<div class="section-header">📊 Synthèse Salles Libres</div>', unsafe_allow_html=True)
-        synth = []
-        week_start = get_week_start_from_label(selected_month, selected_semaine, week_ranges)
-        for jour in JOURS:
-            for c in CRENEAUX_JOUR:
-                key = f"{selected_semaine}-{jour}-{c}"
-                d = day_date(week_start, JOURS.index(jour))
-                holiday = True if (d and is_holiday(d)) else False
-                occ = set()
-                if not holiday:
-                    for f, fd in parsed['schedule'].items():
-                        s = fd['slots'].get(key)
-                        if s and s[0]:
-                            occ.add(s[1].replace(' (CONFLIT NON RESOLU)','').replace(' (Conflit)',''))
-                libres = sorted(list(set(parsed['salles']) - occ))
-                synth.append({'Jour': jour, 'Créneau': c, 'Horaire': HORAIRES[c], 'Nb Salles Libres': len(libres), 'Salles Disponibles': ', '.join(libres) if libres else 'Aucune'})
-        st.dataframe(pd.DataFrame(synth), use_container_width=True)
+        synth_key = ('salles_libres', selected_month, selected_semaine)
+        if synth_key not in week_cache:
+            week_cache[synth_key] = build_salles_libres(parsed['salles'], occupancy, week_slot_keys, week_holidays)
+        st.dataframe(week_cache[synth_key], use_container_width=True)
 
     with tab5:
         st.markdown('<div class="section-header">📈 Analyse de la Charge par Groupe</div>', unsafe_allow_html=True)
         st.info(f"📅 Analyse pour : **{selected_month} - {selected_semaine}**")
 
-        charge_groupes = []
-        for groupe in parsed['groupes']:
-            heures_total = 0
-            nb_creneaux = 0
-            for jour in JOURS:
-                for creneau in CRENEAUX_JOUR:
-                    slot_key = f"{selected_semaine}-{jour}-{creneau}"
-                    for formateur, f_data in parsed['schedule'].items():
-                        slot_data = f_data['slots'].get(slot_key)
-                        if slot_data and slot_data[0] == groupe:
-                            heures_total += SLOT_DURATIONS[creneau]
-                            nb_creneaux += 1
-                            break
-            charge_groupes.append({'Groupe': groupe, 'Heures de Formation': heures_total, 'Nombre de Créneaux': nb_creneaux})
-
-        if not charge_groupes:
+        charge_key = ('charge', selected_month, selected_semaine)
+        if charge_key not in week_cache:
+            week_cache[charge_key] = build_charge_groupes(parsed['groupes'], owners, week_slot_keys, f'{selected_month} {selected_semaine}')
+        charge_analysis = week_cache[charge_key]
+
+        if charge_analysis is None:
             st.info("Aucune donnée de charge disponible pour la semaine sélectionnée.")
         else:
-            df_charge = pd.DataFrame(charge_groupes)
-            if 'Heures de Formation' not in df_charge.columns:
-                st.warning("La colonne 'Heures de Formation' est manquante dans les données ; affichage interrompu.")
-                st.dataframe(df_charge, use_container_width=True)
-            else:
-                df_charge = df_charge.sort_values('Heures de Formation', ascending=False)
-                moyenne_heures = df_charge['Heures de Formation'].mean()
-                col_met1, col_met2, col_met3, col_met4 = st.columns(4)
-                with col_met1:
-                    st.metric("Groupes Total", len(df_charge))
-                with col_met2:
-                    st.metric("Charge Moyenne", f"{moyenne_heures:.1f}h")
-                with col_met3:
-                    st.metric("Charge Minimale", f"{df_charge['Heures de Formation'].min():.1f}h")
-                with col_met4:
-                    st.metric("Charge Maximale", f"{df_charge['Heures de Formation'].max():.1f}h")
-
-                import plotly.graph_objects as go
-                colors = []
-                seuil_bas = moyenne_heures * 0.85
-                seuil_haut = moyenne_heures * 1.15
-                for heures in df_charge['Heures de Formation']:
-                    if heures > seuil_haut:
-                        colors.append('#d32f2f')
-                    elif heures >= seuil_bas and heures <= seuil_haut:
-                        colors.append('#fbc02d')
-                    else:
-                        colors.append('#388e3c')
-                fig = go.Figure(data=[go.Bar(x=df_charge['Groupe'], y=df_charge['Heures de Formation'], text=df_charge['Heures de Formation'].apply(lambda x: f"{x:.1f}h"), textposition='outside', marker=dict(color=colors, line=dict(color='#1e5631', width=1.5)), hovertemplate='<b>%{x}</b><br>Heures: %{y:.1f}h<br><extra></extra>')])
-                fig.add_hline(y=moyenne_heures, line_dash="dash", line_color="#1e5631", annotation_text=f"Moyenne: {moyenne_heures:.1f}h", annotation_position="right")
-                fig.add_hline(y=seuil_haut, line_dash="dot", line_color="#d32f2f", opacity=0.5)
-                fig.add_hline(y=seuil_bas, line_dash="dot", line_color="#388e3c", opacity=0.5)
-                fig.update_layout(title={'text': f'Charge Horaire par Groupe - {selected_month} {selected_semaine}', 'x': 0.5}, xaxis_title='Groupes', yaxis_title='Heures de Formation', plot_bgcolor='white', paper_bgcolor='#f8faf9', height=500, showlegend=False, xaxis=dict(tickangle=-45, gridcolor='lightgray'), yaxis=dict(gridcolor='lightgray'))
+            df_charge, moyenne_heures, seuil_bas, seuil_haut, fig = charge_analysis
+            col_met1, col_met2, col_met3, col_met4 = st.columns(4)
+            with col_met1:
+                st.metric("Groupes Total", len(df_charge))
+            with col_met2:
+                st.metric("Charge Moyenne", f"{moyenne_heures:.1f}h")
+            with col_met3:
+                st.metric("Charge Minimale", f"{df_charge['Heures de Formation'].min():.1f}h")
+            with col_met4:
+                st.metric("Charge Maximale", f"{df_charge['Heures de Formation'].max():.1f}h")
+            if len(df_charge) > CHARGE_PLOT_MAX_GROUPES and st.checkbox(f"Afficher les {len(df_charge)} groupes sur le graphique", key="charge_tous_groupes"):
+                fig_key = ('charge_figure_complete', selected_month, selected_semaine)
+                if fig_key not in week_cache:
+                    week_cache[fig_key] = build_charge_figure(df_charge, moyenne_heures, seuil_bas, seuil_haut, f'{selected_month} {selected_semaine}')
+                fig = week_cache[fig_key]
+            if fig is not None:
                 st.plotly_chart(fig, use_container_width=True)
-                st.markdown("---")
-                def categoriser_charge_moyenne(heures, moyenne, seuil_bas, seuil_haut):
-                    if heures > seuil_haut:
-                        return "🔴 Trop Chargé"
-                    elif heures >= seuil_bas and heures <= seuil_haut:
-                        return "🟡 Chargé"
-                    else:
-                        return "🟢 Normal"
-                df_charge['Catégorie'] = df_charge['Heures de Formation'].apply(lambda x: categoriser_charge_moyenne(x, moyenne_heures, seuil_bas, seuil_haut))
-                df_charge['Écart/Moyenne'] = df_charge['Heures de Formation'] - moyenne_heures
-                df_charge['Écart/Moyenne'] = df_charge['Écart/Moyenne'].apply(lambda x: f"{x:+.1f}h")
-                st.dataframe(df_charge, use_container_width=True)
-                st.markdown("---")
-                st.info(f"""
+            else:
+                st.info("Installez plotly pour afficher le graphique de charge.")
+            st.markdown("---")
+            st.dataframe(df_charge, use_container_width=True, column_config={'Écart/Moyenne': st.column_config.NumberColumn(format='%+.1fh')})
+            st.markdown("---")
+            st.info(f"""
                 **Légende:**
                 - 🔴 **Trop Chargé**: > {seuil_haut:.1f}h (au-dessus de +15% de la moyenne)
                 - 🟡 **Chargé**: {seuil_bas:.1f}h - {seuil_haut:.1f}h (proche de la moyenne ±15%)
                 - 🟢 **Normal**: < {seuil_bas:.1f}h (inférieur de -15% de la moyenne - Pas chargé)
                 """)
-                col_stat1, col_stat2, col_stat3 = st.columns(3)
-                with col_stat1:
-                    nb_trop_charge = len(df_charge[df_charge['Heures de Formation'] > seuil_haut])
-                    st.markdown(f"""<div class="metric-card" style="border-left-color: #d32f2f;"><div class="metric-value">{nb_trop_charge}</div><div class="metric-label">🔴 Trop Chargés<br/>(Au-dessus moyenne)</div></div>""", unsafe_allow_html=True)
-                with col_stat2:
-                    nb_charge = len(df_charge[(df_charge['Heures de Formation'] >= seuil_bas) & (df_charge['Heures de Formation'] <= seuil_haut)])
-                    st.markdown(f"""<div class="metric-card" style="border-left-color: #fbc02d;"><div class="metric-value">{nb_charge}</div><div class="metric-label">🟡 Chargés<br/>(Proche moyenne)</div></div>""", unsafe_allow_html=True)
-                with col_stat3:
-                    nb_normal = len(df_charge[df_charge['Heures de Formation'] < seuil_bas])
-                    st.markdown(f"""<div class="metric-card" style="border-left-color: #388e3c;"><div class="metric-value">{nb_normal}</div><div class="metric-label">🟢 Normaux<br/>(En bas de la moyenne - Pas chargé)</div></div>""", unsafe_allow_html=True)
-                st.markdown("---")
-                if st.button("📥 Exporter l'Analyse de Charge (Excel)", key="btn_export_charge"):
-                    wb_charge = openpyxl.Workbook()
-                    ws = wb_charge.active
-                    ws.title = sanitize_sheet_title("Charge_Groupes")
-                    ws.sheet_view.showGridLines = False
-                    border_thin = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-                    header_font = Font(bold=True, size=11, color="FFFFFF")
-                    title_font = Font(bold=True, size=14, color="1e5631")
-                    header_fill = PatternFill(start_color="2d8659", end_color="2d8659", fill_type="solid")
-                    center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                    ws['A1'] = f'ANALYSE DE CHARGE PAR GROUPE - {selected_month} {selected_semaine}'
-                    ws.merge_cells('A1:E1'); ws['A1'].font = title_font; ws['A1'].alignment = center_align; ws.row_dimensions[1].height = 25
-                    ws['A2'] = f'Moyenne: {moyenne_heures:.1f}h | Seuils: Normal < {seuil_bas:.1f}h | Chargé: {seuil_bas:.1f}h-{seuil_haut:.1f}h | Trop Chargé > {seuil_haut:.1f}h'
-                    ws.merge_cells('A2:E2'); ws['A2'].alignment = center_align; ws.row_dimensions[2].height = 20
-                    ws['A4'] = 'Groupe'; ws['B4'] = 'Heures de Formation'; ws['C4'] = 'Nombre de Créneaux'; ws['D4'] = 'Niveau de Charge'; ws['E4'] = 'Écart/Moyenne'
-                    for col in ['A','B','C','D','E']:
-                        ws[f'{col}4'].font = header_font; ws[f'{col}4'].fill = header_fill; ws[f'{col}4'].border = border_thin; ws[f'{col}4'].alignment = center_align; ws.column_dimensions[col].width = 25
-                    row = 5
-                    for _, data_row in df_charge.iterrows():
-                        ws[f'A{row}'] = data_row['Groupe']; ws[f'B{row}'] = data_row['Heures de Formation']; ws[f'C{row}'] = data_row['Nombre de Créneaux']; ws[f'D{row}'] = data_row['Catégorie']; ws[f'E{row}'] = data_row['Écart/Moyenne']
-                        for col in ['A','B','C','D','E']:
-                            ws[f'{col}{row}'].border = border_thin; ws[f'{col}{row}'].alignment = center_align
-                        row += 1
-                    excel_bytes = excel_to_bytes(wb_charge)
-                    st.download_button("💾 Télécharger l'Analyse", excel_bytes, f"Charge_Groupes_{selected_month}_{selected_semaine}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+            col_stat1, col_stat2, col_stat3 = st.columns(3)
+            with col_stat1:
+                nb_trop_charge = len(df_charge[df_charge['Heures de Formation'] > seuil_haut])
+                st.markdown(f"""<div class="metric-card" style="border-left-color: #d32f2f;"><div class="metric-value">{nb_trop_charge}</div><div class="metric-label">🔴 Trop Chargés<br/>(Au-dessus moyenne)</div></div>""", unsafe_allow_html=True)
+            with col_stat2:
+                nb_charge = len(df_charge[(df_charge['Heures de Formation'] >= seuil_bas) & (df_charge['Heures de Formation'] <= seuil_haut)])
+                st.markdown(f"""<div class="metric-card" style="border-left-color: #fbc02d;"><div class="metric-value">{nb_charge}</div><div class="metric-label">🟡 Chargés<br/>(Proche moyenne)</div></div>""", unsafe_allow_html=True)
+            with col_stat3:
+                nb_normal = len(df_charge[df_charge['Heures de Formation'] < seuil_bas])
+                st.markdown(f"""<div class="metric-card" style="border-left-color: #388e3c;"><div class="metric-value">{nb_normal}</div><div class="metric-label">🟢 Normaux<br/>(En bas de la moyenne - Pas chargé)</div></div>""", unsafe_allow_html=True)
+            st.markdown("---")
+            if st.button("📥 Exporter l'Analyse de Charge (Excel)", key="btn_export_charge"):
+                wb_charge = create_excel_charge_groupes(df_charge, moyenne_heures, seuil_bas, seuil_haut, f'{selected_month} {selected_semaine}')
+                excel_bytes = excel_to_bytes(wb_charge)
+                st.download_button("💾 Télécharger l'Analyse", excel_bytes, f"Charge_Groupes_{selected_month}_{selected_semaine}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
 
 st.markdown("---")
 st.markdown("<div style='text-align:center;color:#666;padding:1rem;'>Développé par ISMAILI ALAOUI Mohamed — CFP TLRA/IFMLT</div>", unsafe_allow_html=True)
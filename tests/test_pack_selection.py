@@ -0,0 +1,62 @@
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+APP = str(Path(__file__).resolve().parents[1] / "app.py")
+MOIS = "Novembre"
+SEMAINE = "Semaine 1"
+
+
+def _resolved_data(n_formateurs=6):
+    formateurs = [f"Formateur {i:02d}" for i in range(n_formateurs)]
+    schedule = {
+        form: {'salle': 'S1', 'slots': {f"{SEMAINE}-Lundi-AM1": (f"G{i:02d}", 'S1')}}
+        for i, form in enumerate(formateurs)
+    }
+    return {MOIS: {
+        'month': MOIS,
+        'schedule': schedule,
+        'formateurs': formateurs,
+        'groupes': sorted({slot[0] for fd in schedule.values() for slot in fd['slots'].values()}),
+        'salles': ['S1'],
+        'semaines': [SEMAINE],
+        'week_ranges': {},
+        'header_idx': 0,
+    }}
+
+
+def _app_on_week():
+    at = AppTest.from_file(APP, default_timeout=30)
+    at.session_state['resolved_data'] = _resolved_data()
+    at.run()
+    at.selectbox[0].select(MOIS).run()
+    at.selectbox[1].select(SEMAINE).run()
+    return at
+
+
+def _pack_formateurs(at):
+    return next(w for w in at.multiselect if w.label == "Formateurs à inclure dans le pack")
+
+
+def test_successive_deselections_all_apply():
+    at = _app_on_week()
+    at.checkbox(key="pack_form_tous").uncheck().run()
+    assert len(_pack_formateurs(at).value) == 6
+
+    _pack_formateurs(at).unselect("Formateur 00").run()
+    assert len(_pack_formateurs(at).value) == 5
+    _pack_formateurs(at).unselect("Formateur 03").run()
+    value = _pack_formateurs(at).value
+    assert len(value) == 4
+    assert "Formateur 00" not in value and "Formateur 03" not in value
+
+
+def test_selection_survives_hiding_the_list():
+    at = _app_on_week()
+    at.checkbox(key="pack_form_tous").uncheck().run()
+    _pack_formateurs(at).unselect("Formateur 01").run()
+
+    at.checkbox(key="pack_form_tous").check().run()
+    at.checkbox(key="pack_form_tous").uncheck().run()
+    assert "Formateur 01" not in _pack_formateurs(at).value
+    assert len(_pack_formateurs(at).value) == 5